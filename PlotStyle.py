@@ -1,7 +1,7 @@
-from ROOT import *
+from lazyRoot import ROOT
 
-# this style is initialized below
-Style = TStyle("SWup","Modified ATLAS style")
+# this style is initialized when ROOT is imported
+Style = None
 
 TitleEvents = "events"
 TitleNorm = "event fraction"
@@ -11,18 +11,18 @@ YMaxFactorLin = 1.3
 OBJECTS = []
 
 def legend(leg):
-	leg.SetFillColor(kWhite)
+	leg.SetFillColor(ROOT.kWhite)
 
 def single_hist(hist):
-	hist.SetLineColor(kBlack)
+	hist.SetLineColor(ROOT.kBlack)
 	hist.SetLineWidth(3)
-	hist.SetFillColor(kGray)
+	hist.SetFillColor(ROOT.kGray)
 
 def comp_hist(hist):
 	hist.SetLineWidth(3)
 
 def string(x, y, text, rel=None):
-	obj = TLatex(x, y, text)
+	obj = ROOT.TLatex(x, y, text)
 	obj.SetNDC()
 	if rel:
 		obj.SetTextSize(rel * obj.GetTextSize())
@@ -31,8 +31,9 @@ def string(x, y, text, rel=None):
 	global OBJECTS
 	OBJECTS.append(obj)
 
-def _init_style():
+def _init_style(module=None):
 	global Style
+	Style = ROOT.TStyle("SWup","Modified ATLAS style")
 	# use plain black on white colors
 	Style.SetOptStat(0)
 	_icol=0
@@ -81,9 +82,9 @@ def _init_style():
 
 	Style.SetPalette(53)
 
-	TGaxis.SetMaxDigits(4)
+	ROOT.TGaxis.SetMaxDigits(4)
 
-	gROOT.SetStyle("SWup")
-	gROOT.ForceStyle()
+	ROOT.gROOT.SetStyle("SWup")
+	ROOT.gROOT.ForceStyle()
 
-_init_style()
+ROOT.whenLoaded(_init_style)
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+import sys
+import os
+import time
+import json
+import itertools
+import resource
+import subprocess
+import tempfile
+from collections import namedtuple
+import numpy
+
+import utils
+import lazyRoot
+from lazyRoot import ROOT
+import configuration
+from tabulate import tabulate
+from ratingMethods import *
+
+###############################
+# benchmark of the optimisation on synthetic samples, no input files are needed
+# the samples are multivariate gaussians: the backgrounds are centered at 0, the signal is shifted,
+# all variables have the same correlation with each other
+
+Range = namedtuple("Range", "min max nBins lower_cut")
+BenchmarkPoint = namedtuple("BenchmarkPoint", "events nBins variables backgrounds")
+
+TREE_NAME = "tree"
+
+###############################
+
+def generateSample(filename, nEvents, nVariables, correlation, shift, seed):
+	# writes a tree with the variables var0 .. varN-1 and a positive event weight
+	rng = numpy.random.RandomState(seed)
+	covariance = numpy.full((nVariables, nVariables), correlation) + (1. - correlation) * numpy.identity(nVariables)
+	mean = numpy.array([shift * (1. - float(i) / nVariables) for i in xrange(nVariables)])
+	values = rng.multivariate_normal(mean, covariance, size=nEvents)
+	weights = rng.lognormal(0., 0.3, size=nEvents)
+
+	# the tree is read from a text file, which is much faster than filling it event by event from python
+	textFile = filename + ".txt"
+	numpy.savetxt(textFile, numpy.column_stack([values, weights]), fmt="%.6g")
+	rFile = ROOT.TFile(filename, "RECREATE")
+	tree = ROOT.TTree(TREE_NAME, TREE_NAME)
+	tree.ReadFile(textFile, ":".join(["var%d/D" % i for i in xrange(nVariables)] + ["weight/D"]))
+	tree.Write()
+	rFile.Close()
+	os.remove(textFile)
+
+def getSample(directory, name, nEvents, nVariables, correlation, shift, seed):
+	# the generated files are reused by later runs
+	filename = os.path.join(directory, "%s_%d_%d_%g.root" % (name, nEvents, nVariables, correlation))
+	if not os.path.exists(filename):
+		if not os.path.exists(directory):
+			os.makedirs(directory)
+		generateSample(filename, nEvents, nVariables, correlation, shift, seed)
+	return utils.load_chain([filename], TREE_NAME)
+
+def getConfig(opts, point):
+	config = configuration.Configuration()
+	config.signal = configuration.sample("signal", getSample(opts.directory, "signal", point.events, point.variables, opts.correlation, 1., 1), 1. / opts.signalFraction)
+	config.backgrounds = [configuration.sample("bkg%d" % i, getSample(opts.directory, "bkg%d" % i, point.events, point.variables, opts.correlation, 0., 100 + i)) for i in xrange(point.backgrounds)]
+	config.Variables = dict(("var%d" % i, Range(-4., 4., point.nBins, False)) for i in xrange(point.variables))
+	config.event_weight = "weight"
+	config.lumi = 1.
+	config.flatBkgUncertainty = 0.2
+	config.rankingMethod = opts.method
+	config.optimisationMethod = opts.method
+	config.scanMode = opts.scanMode
+	config.use_cache = opts.use_cache
+	config.maxMemory = opts.maxMemory
+	return config
+
+###############################
+
+def benchGetOptimalCut(opts, config):
+	from getOptimalCut import CutFinder
+	from optimisation import initObject
+
+	finder = CutFinder()
+	initObject(finder, config)
+	finder.method = getMethod(opts.method, METHODS)
+	rangeDef = config.Variables["var0"]
+	finder.getOptimalCut("var0", rangeDef.nBins, rangeDef.min, rangeDef.max, rangeDef.lower_cut)
+
+def benchRankVariables(opts, config):
+	from getOptimalCut import CutFinder
+	from rankVariables import VariableRanker
+	from optimisation import initObject
+
+	config.method = getMethod(opts.method, METHODS)
+	ranker = VariableRanker()
+	initObject(ranker, config, True)
+	ranker.finder = CutFinder()
+	initObject(ranker.finder, config)
+	ranker.rankVariables(config.Variables)
+
+def benchOptimiseCuts(opts, config):
+	from optimisation import optimiseCuts
+	from eventCache import EventCache
+	from outputWriter import OutputWriter
+
+	rFile = OutputWriter(os.path.join(opts.directory, "benchmark_output.root"), config.writeInBackground)
+	cache = None
+	if config.use_cache:
+		cache = EventCache(config.Variables, config.event_weight, config.preselection, config.maxMemory)
+		cache.load(config.signal, config.backgrounds)
+	optimiseCuts(config, rFile, cache)
+	rFile.Close()
+
+BENCHMARKS = [
+	("getOptimalCut", benchGetOptimalCut),
+	("rankVariables", benchRankVariables),
+	("optimiseCuts", benchOptimiseCuts),
+]
+
+###############################
+
+def runBenchmark(opts, name, point):
+	# runs in a new python process (see startBenchmark), such that the peak memory belongs to this benchmark only
+	lazyRoot.batchMode(2001)
+	config = getConfig(opts, point)
+	function = dict(BENCHMARKS)[name]
+
+	# the output of the optimisation is not needed
+	stdout = sys.stdout
+	sys.stdout = open(os.devnull, "w")
+	try:
+		start = time.time()
+		function(opts, config)
+		seconds = time.time() - start
+	finally:
+		sys.stdout.close()
+		sys.stdout = stdout
+
+	nEvents = point.events * (point.backgrounds + 1)
+	peakMemory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024. # in MB
+	return {"benchmark": name, "point": point._asdict(), "seconds": seconds, "events per second": nEvents / seconds, "peak memory [MB]": peakMemory}
+
+def startBenchmark(name, point):
+	# a new interpreter instead of a forked process: a fork would start with the memory of this process (ROOT, the chains)
+	resultFile = tempfile.NamedTemporaryFile(suffix=".json", delete=False)
+	resultFile.close()
+	try:
+		command = [sys.executable, os.path.abspath(__file__)] + sys.argv[1:] + ["--run", name, "--point", ",".join(str(value) for value in point), "--result", resultFile.name]
+		subprocess.check_call(command)
+		with open(resultFile.name) as result:
+			return json.load(result)
+	finally:
+		os.remove(resultFile.name)
+
+def getKey(result):
+	point = result["point"]
+	return (result["benchmark"], point["events"], point["nBins"], point["variables"], point["backgrounds"])
+
+def compareBaseline(results, baseline):
+	reference = dict((getKey(result), result) for result in baseline)
+	table = []
+	for result in results:
+		key = getKey(result)
+		if key not in reference:
+			continue
+		old = reference[key]
+		table.append(list(key) + [old["seconds"], result["seconds"], result["seconds"] / old["seconds"], result["peak memory [MB]"] / old["peak memory [MB]"]])
+	print "\n\nCOMPARISON TO THE BASELINE\n"
+	print tabulate(table, headers=["benchmark", "events", "nBins", "variables", "backgrounds", "baseline [s]", "time [s]", "time ratio", "memory ratio"], tablefmt="simple")
+
+###############################
+
+def parse_options():
+		import argparse
+
+		def intList(value):
+			return [int(v) for v in value.split(",")]
+
+		parser = argparse.ArgumentParser(description="benchmark of the optimisation on synthetic samples")
+		parser.add_argument("--events", type=intList, default=[10000, 100000], help="comma separated numbers of events per sample")
+		parser.add_argument("--nbins", type=intList, default=[50, 200], help="comma separated numbers of bins")
+		parser.add_argument("--variables", type=intList, default=[5, 20], help="comma separated numbers of variables")
+		parser.add_argument("--backgrounds", type=intList, default=[1, 3], help="comma separated numbers of background samples")
+		parser.add_argument("--correlation", type=float, default=0.3, help="correlation between all variables")
+		parser.add_argument("--signal-fraction", dest="signalFraction", type=float, default=100., help="the signal weights are divided by this number")
+		parser.add_argument("--benchmarks", default=",".join(name for name, function in BENCHMARKS), help="comma separated benchmarks which should be run")
+		parser.add_argument("-m", "--method", choices=[m.name for m in METHODS], default="sig", help="which method should be used for the optimisation")
+		parser.add_argument("--scan-mode", dest="scanMode", choices=["loop", "prefix", "unbinned"], default="loop", help="the scan mode of the CutFinder")
+		parser.add_argument("--use-cache", dest="use_cache", action="store_true", help="keep the events in memory for optimiseCuts")
+		parser.add_argument("--max-memory", dest="maxMemory", type=float, default=None, help="read the trees in chunks such that the buffers stay below this size (in bytes)")
+		parser.add_argument("--directory", default="benchmark", help="directory for the generated samples")
+		parser.add_argument("--output", default=None, help="json file for the results")
+		parser.add_argument("--baseline", default=None, help="json file with the results of an earlier run which should be compared")
+		# used by startBenchmark to run a single benchmark in a new process
+		parser.add_argument("--run", default=None, help=argparse.SUPPRESS)
+		parser.add_argument("--point", type=intList, default=None, help=argparse.SUPPRESS)
+		parser.add_argument("--result", default=None, help=argparse.SUPPRESS)
+
+		opts = parser.parse_args()
+		return opts
+
+###############################
+
+def main():
+	lazyRoot.batchMode()
+	opts = parse_options()
+
+	if opts.run:
+		result = runBenchmark(opts, opts.run, BenchmarkPoint(*opts.point))
+		with open(opts.result, "w") as output:
+			json.dump(result, output)
+		return
+
+	names = opts.benchmarks.split(",")
+	points = [BenchmarkPoint(*values) for values in itertools.product(opts.events, opts.nbins, opts.variables, opts.backgrounds)]
+
+	# the samples are generated before the benchmarks are started
+	for point in points:
+		getConfig(opts, point)
+
+	results = []
+	table = []
+	for point in points:
+		for name in names:
+			result = startBenchmark(name, point)
+			results.append(result)
+			table.append([name, point.events, point.nBins, point.variables, point.backgrounds, result["seconds"], result["events per second"], result["peak memory [MB]"]])
+
+	print tabulate(table, headers=["benchmark", "events", "nBins", "variables", "backgrounds", "time [s]", "events / s", "peak memory [MB]"], tablefmt="simple")
+
+	if opts.output:
+		with open(opts.output, "w") as output:
+			json.dump(results, output, indent=2, sort_keys=True)
+
+	if opts.baseline:
+		with open(opts.baseline) as baseline:
+			compareBaseline(results, json.load(baseline))
+
+###############################
+
+if __name__ == '__main__':
+	main()
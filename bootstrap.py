@@ -0,0 +1,34 @@
+import math
+import zlib
+import numpy
+
+###############################
+# poisson bootstrap: every event gets K replica weights drawn from a Poisson distribution with mean 1
+# the weights are a hash of the entry number, the sample name and the seed, such that an event has the
+# same replica weights for every variable and in every iteration, without storing them
+
+# P(k <= n) for a Poisson distribution with mean 1
+POISSON_CDF = numpy.cumsum([math.exp(-1.) / math.factorial(k) for k in xrange(20)])
+
+def _mix(x):
+	# finaliser of splitmix64, a good 64 bit hash of consecutive numbers
+	x = (x ^ (x >> numpy.uint64(30))) * numpy.uint64(0xbf58476d1ce4e5b9)
+	x = (x ^ (x >> numpy.uint64(27))) * numpy.uint64(0x94d049bb133111eb)
+	return x ^ (x >> numpy.uint64(31))
+
+def replicaWeights(entries, nReplicas, name, seed):
+	# array (nReplicas, nEvents) of the (integer) replica weights of the events with the given entry numbers
+	key = numpy.uint64((zlib.crc32(name) & 0xffffffff) << 32 | (seed & 0xffffffff))
+	entries = numpy.asarray(entries, dtype=numpy.int64).astype(numpy.uint64)
+	replicas = numpy.arange(1, nReplicas + 1, dtype=numpy.uint64)[:, numpy.newaxis]
+	with numpy.errstate(over="ignore"):
+		hashes = _mix(((entries * numpy.uint64(0x9e3779b97f4a7c15)) ^ key)[numpy.newaxis, :] + replicas * numpy.uint64(0xd1b54a32d192ed03))
+	uniform = (hashes >> numpy.uint64(11)).astype(numpy.float64) * 2.**-53
+	return numpy.searchsorted(POISSON_CDF, uniform, side="right").astype(numpy.uint8)
+
+def spread(values):
+	# standard deviation of the values of all replicas, None if there are none
+	values = [v for v in values if v is not None]
+	if not values:
+		return None
+	return float(numpy.std(values, axis=0)) if numpy.ndim(values) == 1 else tuple(numpy.std(values, axis=0))
@@ -1,4 +1,4 @@
-import ROOT
+from lazyRoot import ROOT
 from collections import namedtuple
 Sample = namedtuple("Sample", "name chain weight color MCboundary")
 
@@ -23,22 +23,47 @@ damping_funcs = {
 class Configuration(object):
 	def __init__(self):
 		self.signal = None
+		self.signals = None # list of signal samples (e.g. a mass grid), all of them are optimised against the same backgrounds
+		self.signalGridMode = "perPoint" # "perPoint": one cut list for each signal, "compromise": one cut list for all signals
 		self.backgrounds = None
 		self.Variables = None
 		self.preselection = "1"
 		self.event_weight = 1.
 		self.lumi = 10e3
 		self.enable_plots = False
+		self.plotProcesses = 2 # number of processes which make the plots while the optimisation continues (0: the plots are made directly)
+		self.plotsPerIteration = False # if enabled, the plots of each iteration are saved as pages of one pdf file instead of single png and pdf files
+		self.plotter = None # set by the optimisation when the plots are enabled
 		self.rankingMethod = "sig"
 		self.optimisationMethod = "sig"
 		self.flatBkgUncertainty = None
 		self.method = None
 		self.use_validation = False # if enabled, an output tree is produced
+		self.writeInBackground = True # the output ROOT file is written by a separate thread while the optimisation continues
+		self.profile = False # if enabled, the time spent in the expensive steps and the number of events and bytes read are printed and written to a json file
 		self.includeMCstat = False
+		self.pruneBranches = True # only the branches used by the variables, the weights and the preselection are read
+		self.use_cache = False # if enabled, all events passing the preselection are kept in memory
+		self.beamWidth = 1 # number of cut sequences kept after each iteration (1: only the best cut is applied)
+		self.evolutionPopulation = 0 # if > 0, all cuts are searched at once by an evolutionary algorithm with this number of candidates per generation
+		self.evolutionGenerations = 50
+		self.evolutionSeed = 1
+		self.scanMode = "loop" # "prefix": all cut values are evaluated at once from cumulative sums, "unbinned": exact scan of the sorted events
+		self.unbinnedPoints = None # if set, the unbinned scan only evaluates this number of cut values (at quantiles of the events)
+		self.nProcesses = 1 # number of processes used to rank the variables
+		self.nFillProcesses = 1 # number of processes sharing the files of a chain when the histograms are filled
+		self.histCacheDir = None # if set, the filled histograms are stored in this directory and reused by later runs
+		self.histCacheSize = 1e9 # maximum size of the histogram cache in bytes
+		self.maxMemory = None # if set (in bytes), the chains are read in chunks of entries such that the buffers stay below this size
+		self.bootstrapReplicas = 0 # if > 0, the spread of each optimal cut and rating over this number of poisson bootstrap replicas is reported
+		self.bootstrapSeed = 1
+		self.fineBins = None # if set, the variables are filled with this number of bins and rebinned to the requested nBins
 
 		self.damp_func = None
 
-def sample(name, chain, weight=1.0, color=ROOT.kBlack, MCboundary=10.):
+def sample(name, chain, weight=1.0, color=None, MCboundary=10.):
+	if color is None:
+		color = ROOT.kBlack
 	return Sample(name, chain, weight, color, MCboundary)
 
 def load_config(filename):
@@ -54,6 +79,7 @@ def load_config(filename):
 		"Damp": damping_funcs,
 		'ROOT': ROOT,
 		'Range': Range,
+		'Window': utils.WINDOW,
 		'Sample': sample,
 	}
 
@@ -0,0 +1,115 @@
+import numpy
+
+import utils
+
+###############################
+# search for the cuts on all variables at once, the candidates are rows of a matrix
+# each variable has one column (the cut value) or two columns for a window (low, high)
+# a variable is not cut, if its cut value is at the edge of the range which keeps all events
+# (min for an upper cut, max for a lower cut, both edges for a window)
+
+def getColumns(ranges):
+	# first column of each variable and the range of each column
+	columns = []
+	mins = []
+	maxs = []
+	steps = []
+	for rangeDef in ranges:
+		columns.append(len(mins))
+		nColumns = 2 if rangeDef.lower_cut == utils.WINDOW else 1
+		for i in xrange(nColumns):
+			mins.append(rangeDef.min)
+			maxs.append(rangeDef.max)
+			steps.append(float(rangeDef.max - rangeDef.min) / rangeDef.nBins)
+	return columns, numpy.array(mins, dtype=float), numpy.array(maxs, dtype=float), numpy.array(steps)
+
+def snapCuts(cuts, mins, maxs, steps):
+	# the cut values are moved to the bin edges of the ranges
+	return numpy.clip(mins + numpy.round((cuts - mins) / steps) * steps, mins, maxs)
+
+def looseCuts(ranges, mins, maxs):
+	# the cut values for which no event is removed
+	loose = mins.copy()
+	columns = getColumns(ranges)[0]
+	for rangeDef, column in zip(ranges, columns):
+		if rangeDef.lower_cut == utils.WINDOW:
+			loose[column + 1] = maxs[column + 1]
+		elif rangeDef.lower_cut:
+			loose[column] = maxs[column]
+	return loose
+
+def sortWindows(cuts, ranges, columns):
+	for rangeDef, column in zip(ranges, columns):
+		if rangeDef.lower_cut == utils.WINDOW:
+			low = numpy.minimum(cuts[:, column], cuts[:, column + 1])
+			high = numpy.maximum(cuts[:, column], cuts[:, column + 1])
+			cuts[:, column] = low
+			cuts[:, column + 1] = high
+	return cuts
+
+def randomCuts(rng, nCandidates, ranges, looseProbability):
+	# uniformly distributed cut values, each variable is not cut with the given probability
+	columns, mins, maxs, steps = getColumns(ranges)
+	cuts = mins + rng.uniform(size=(nCandidates, len(mins))) * (maxs - mins)
+	loose = rng.uniform(size=cuts.shape) < looseProbability
+	cuts = numpy.where(loose, looseCuts(ranges, mins, maxs), cuts)
+	return sortWindows(snapCuts(cuts, mins, maxs, steps), ranges, columns)
+
+def mutateCuts(rng, parents, ranges, width, looseProbability):
+	# gaussian steps with the given width (relative to the range), some cut values are released
+	columns, mins, maxs, steps = getColumns(ranges)
+	cuts = parents + rng.normal(size=parents.shape) * width * (maxs - mins)
+	loose = rng.uniform(size=cuts.shape) < looseProbability
+	cuts = numpy.where(loose, looseCuts(ranges, mins, maxs), cuts)
+	return sortWindows(snapCuts(cuts, mins, maxs, steps), ranges, columns)
+
+###############################
+
+def passedEvents(values, cuts, ranges):
+	# boolean matrix (candidates, events), values: list of the event values for each variable
+	columns, mins, maxs, steps = getColumns(ranges)
+	passed = numpy.ones((len(cuts), len(values[0])), dtype=bool)
+	for value, rangeDef, column in zip(values, ranges, columns):
+		value = value[numpy.newaxis, :]
+		if rangeDef.lower_cut == utils.WINDOW:
+			low = cuts[:, column]
+			high = cuts[:, column + 1]
+			active = (low > mins[column]) | (high < maxs[column + 1])
+			cond = (value > low[:, numpy.newaxis]) & (value < high[:, numpy.newaxis])
+		elif rangeDef.lower_cut:
+			high = cuts[:, column]
+			active = high < maxs[column]
+			# events where the variable is not defined never pass a cut (same as in EventCache.cutSample)
+			cond = (value < high[:, numpy.newaxis]) & (value != utils.MISSING_VALUE)
+		else:
+			low = cuts[:, column]
+			active = low > mins[column]
+			cond = (value > low[:, numpy.newaxis])
+		passed &= cond | ~active[:, numpy.newaxis]
+	return passed
+
+def passingSums(values, weightsList, cuts, ranges, maxSize=2e7):
+	# sum of each weight array over the events passing each candidate,
+	# the candidates are evaluated in chunks such that the pass matrix has at most maxSize entries
+	weights = numpy.array(weightsList, dtype=float).T
+	chunkSize = max(1, int(maxSize / max(1, len(values[0]))))
+	sums = numpy.zeros((len(cuts), len(weightsList)))
+	for start in xrange(0, len(cuts), chunkSize):
+		passed = passedEvents(values, cuts[start:start + chunkSize], ranges)
+		sums[start:start + chunkSize] = passed.astype(float).dot(weights)
+	return [sums[:, i] for i in xrange(len(weightsList))]
+
+def activeCuts(cut, ranges):
+	# (index, lower_cut, cutValue) of the variables which are cut by a single candidate
+	columns, mins, maxs, steps = getColumns(ranges)
+	result = []
+	for i, (rangeDef, column) in enumerate(zip(ranges, columns)):
+		if rangeDef.lower_cut == utils.WINDOW:
+			if cut[column] > mins[column] or cut[column + 1] < maxs[column + 1]:
+				result.append((i, rangeDef.lower_cut, (float(cut[column]), float(cut[column + 1]))))
+		elif rangeDef.lower_cut:
+			if cut[column] < maxs[column]:
+				result.append((i, rangeDef.lower_cut, float(cut[column])))
+		elif cut[column] > mins[column]:
+			result.append((i, rangeDef.lower_cut, float(cut[column])))
+	return result
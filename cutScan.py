@@ -0,0 +1,89 @@
+import numpy
+
+###############################
+# vectorised evaluation of all cut bins of a histogram
+# the arrays contain all bins including under- and overflow (nbins + 2 entries),
+# backgrounds are stacked along the first axis
+# the result for the cut bin ibin (0 .. nbins-1) uses the same range as CutFinder.calcCutRating:
+# bins 0 .. ibin for lower_cut, otherwise bins ibin .. nbins+1
+
+def cumulative(contents, lower_cut):
+	if lower_cut:
+		return numpy.cumsum(contents, axis=-1)[..., :-2]
+	return numpy.cumsum(contents[..., ::-1], axis=-1)[..., ::-1][..., :-2]
+
+def relativeErrors(sig_nEvents, sig_error2, bkg_nEvents, bkg_error2):
+	# same as calcIntegralError: both relative errors are one, if there is no signal or background
+	empty = (sig_nEvents == 0) | (bkg_nEvents == 0)
+	sig_safe = numpy.where(empty, 1., sig_nEvents)
+	bkg_safe = numpy.where(empty, 1., bkg_nEvents)
+	sig_relerror = numpy.where(empty, 1., numpy.sqrt(sig_error2) / sig_safe)
+	bkg_relerror = numpy.where(empty, 1., numpy.sqrt(bkg_error2) / bkg_safe)
+	return sig_relerror, bkg_relerror
+
+def checkMCStatistics(sig_nMCEvents, bkg_nMCEventsList, sigMCboundary, bkgsMCboundary):
+	passed = (sig_nMCEvents >= sigMCboundary)
+	for i in xrange(len(bkg_nMCEventsList)):
+		passed &= (bkg_nMCEventsList[i] >= bkgsMCboundary[i])
+	return passed
+
+def doDamping(bkg_nEventsList, totalBkgEventsList, damping):
+	# the totals have the shape of the cut arrays without the last axis
+	passed = numpy.ones(bkg_nEventsList.shape[1:], dtype=bool)
+	for i in xrange(len(bkg_nEventsList)):
+		passed &= (bkg_nEventsList[i] >= damping * numpy.asarray(totalBkgEventsList[i])[..., numpy.newaxis])
+	return passed
+
+###############################
+# windows: all bins first .. last inside the histogram range pass
+
+def windowBins(nbins):
+	# first and last bin of all windows inside the histogram range (bins 1 .. nbins)
+	first, last = numpy.triu_indices(nbins)
+	return first + 1, last + 1
+
+def windowSums(contents, first, last):
+	# sum over the bins first .. last for each window, all windows are taken from one cumulative sum
+	shape = contents.shape[:-1] + (1,)
+	cumulative = numpy.concatenate([numpy.zeros(shape), numpy.cumsum(contents, axis=-1)], axis=-1)
+	return cumulative[..., last + 1] - cumulative[..., first]
+
+###############################
+# exact scan on the events instead of the histogram bins
+# events passing a cut: value < cut for lower_cut, otherwise value > cut
+
+def getCandidateCuts(valuesList, minV, maxV, nPoints=None):
+	# cuts halfway between neighbouring distinct values, such that each cut selects a different set of events
+	values = numpy.concatenate(valuesList)
+	values = values[(values >= minV) & (values <= maxV)]
+	distinct = numpy.unique(values)
+	candidates = numpy.unique(numpy.concatenate([[minV], 0.5 * (distinct[1:] + distinct[:-1]), [maxV]]))
+
+	if nPoints and len(candidates) > nPoints:
+		# only the cuts closest to the quantiles of the events are kept
+		ranks = numpy.searchsorted(numpy.sort(values), candidates)
+		targets = numpy.linspace(0, len(values), nPoints)
+		candidates = numpy.unique(candidates[numpy.searchsorted(ranks, targets).clip(0, len(candidates) - 1)])
+	return candidates
+
+def passingSums(values, weightsList, cuts, lower_cut):
+	# sum of each weight array over the events passing each cut, the events are sorted only once
+	# the events are along the last axis of the weights, e.g. (nReplicas, nEvents) for the bootstrap replicas
+	order = numpy.argsort(values, kind="mergesort")
+	values = values[order]
+
+	sums = []
+	if lower_cut:
+		index = numpy.searchsorted(values, cuts, side="left")
+		for weights in weightsList:
+			weights = numpy.asarray(weights, dtype=numpy.float64)[..., order]
+			empty = numpy.zeros(weights.shape[:-1] + (1,))
+			sums.append(numpy.concatenate([empty, numpy.cumsum(weights, axis=-1)], axis=-1)[..., index])
+	else:
+		# summed from the end, such that no cut has a rounding remainder when nothing passes
+		index = numpy.searchsorted(values, cuts, side="right")
+		for weights in weightsList:
+			weights = numpy.asarray(weights, dtype=numpy.float64)[..., order]
+			empty = numpy.zeros(weights.shape[:-1] + (1,))
+			sums.append(numpy.concatenate([numpy.cumsum(weights[..., ::-1], axis=-1)[..., ::-1], empty], axis=-1)[..., index])
+	return sums
@@ -0,0 +1,106 @@
+from collections import namedtuple
+import numpy
+
+import utils
+import bootstrap
+
+###############################
+
+# columns: dict var -> values of all events passing the preselection
+# eventWeights: the evaluated event weight
+# weights: sample weight * preselection, i.e. the weight used for the MC histograms
+# entries: the entry numbers in the chain, for the bootstrap replica weights
+SampleColumns = namedtuple("SampleColumns", "columns eventWeights weights entries")
+
+# indices of the events surviving all cuts, for the signal and for each background
+Selection = namedtuple("Selection", "signal backgrounds")
+
+###############################
+
+class EventCache(object):
+	# keeps the variables of all events passing the preselection in memory,
+	# such that the chains only need to be read once for the whole optimisation
+	def __init__(self, variables, event_weight, preselection, maxMemory=None):
+		self.variables = list(variables)
+		self.event_weight = event_weight
+		self.preselection = preselection
+		self.maxMemory = maxMemory # the chains are read in chunks, such that the buffers of ROOT stay below this size
+		self.signal = None
+		self.backgrounds = []
+		self.selection = None # the events surviving the cuts added so far
+		self.replicaWeights = {} # (sample name, nReplicas, seed) -> bootstrap replica weights of all events of the sample
+
+	def load(self, signal, backgrounds):
+		self.signal = self.loadSample(signal.chain, signal.weight)
+		self.backgrounds = [self.loadSample(bkg.chain, bkg.weight) for bkg in backgrounds]
+		self.selection = Selection(numpy.arange(len(self.signal.weights)), [numpy.arange(len(bkg.weights)) for bkg in self.backgrounds])
+
+	def withSignal(self, signal):
+		# a cache for another signal sample, the backgrounds (and their selection) are shared and not read again
+		cache = EventCache(self.variables, self.event_weight, self.preselection, self.maxMemory)
+		cache.signal = cache.loadSample(signal.chain, signal.weight)
+		cache.backgrounds = self.backgrounds
+		cache.selection = Selection(numpy.arange(len(cache.signal.weights)), self.selection.backgrounds)
+		return cache
+
+	def loadSample(self, tree, extra_weight):
+		columns, weights = utils.readColumnsChunked(tree, self.variables + [str(self.event_weight), utils.ENTRY], str(extra_weight) + "*(" + str(self.preselection) + ")", self.maxMemory)
+		entries = columns.pop()
+		eventWeights = columns.pop()
+		return SampleColumns(dict(zip(self.variables, columns)), eventWeights, weights, entries)
+
+	def cutSample(self, sample, indices, var, lower_cut, cutValue):
+		# only the events which are still selected are looked at
+		values = sample.columns[var][indices]
+		if lower_cut == utils.WINDOW:
+			passed = (values > cutValue[0]) & (values < cutValue[1])
+		elif lower_cut:
+			passed = (values < cutValue)
+		else:
+			passed = (values > cutValue)
+		# events where the variable is not defined never pass a cut (same as in TTree::Draw)
+		passed &= (values != utils.MISSING_VALUE)
+		return indices[passed]
+
+	def applyCut(self, selection, var, lower_cut, cutValue):
+		# returns a new selection, the given one is not changed
+		signal = self.cutSample(self.signal, selection.signal, var, lower_cut, cutValue)
+		backgrounds = [self.cutSample(bkg, indices, var, lower_cut, cutValue) for bkg, indices in zip(self.backgrounds, selection.backgrounds)]
+		return Selection(signal, backgrounds)
+
+	def addCut(self, var, lower_cut, cutValue):
+		self.selection = self.applyCut(self.selection, var, lower_cut, cutValue)
+
+	def addSignalCut(self, var, lower_cut, cutValue, backgrounds):
+		# only the signal is cut, the background selection is taken from a cache with the same backgrounds and cuts
+		self.selection = Selection(self.cutSample(self.signal, self.selection.signal, var, lower_cut, cutValue), backgrounds)
+
+	def fillHistograms(self, binnings, sample, indices, name, lumi, replicas=None):
+		# same output as utils.fillHistograms, but without reading the chain
+		# the bootstrap replica weights are the same as for the events read from the chain
+		weights = sample.weights[indices]
+		eventWeights = sample.eventWeights[indices] * weights * lumi
+		replicaWeights = None
+		if replicas:
+			replicaWeights = self.getReplicaWeights(sample, name, replicas)[:, indices]
+
+		hists = {}
+		for var, (nBins, minV, maxV) in binnings.iteritems():
+			values = sample.columns[var][indices]
+			hist = utils.makeHistogram(name + "_" + utils.sanitise(var), nBins, minV, maxV, values, eventWeights, replicaWeights)
+			histMC = utils.makeHistogram(name + "MC_" + utils.sanitise(var), nBins, minV, maxV, values, weights)
+			hists[var] = (hist, histMC)
+
+		return hists
+
+	def getReplicaWeights(self, sample, name, replicas):
+		# bootstrap replica weights of all events of the sample, from their entry numbers in the chain
+		key = (name,) + tuple(replicas)
+		if key not in self.replicaWeights:
+			self.replicaWeights[key] = bootstrap.replicaWeights(sample.entries, replicas[0], name, replicas[1])
+		return self.replicaWeights[key]
+
+	def getYields(self, sample, indices, lumi):
+		# expected and MC events after the preselection and all cuts
+		weights = sample.weights[indices]
+		return (sample.eventWeights[indices] * weights).sum() * lumi, weights.sum()
@@ -2,79 +2,17 @@
 import sys
 import os
 from math import *
-
-from ROOT import *
-import PlotStyle
+import numpy
 
 import utils
+import cutScan
+import profiling
+import lazyRoot
+import bootstrap
+from plotting import Plot, renderPlots
+from histCache import HistogramCache
 from ratingMethods import *
 
-###############################
-def outputname(name):
-	BAD = "[]$,"
-	for b in BAD:
-		name = name.replace(b,"_")
-	return name
-
-def ensure_dir(d):
-	if not os.path.exists(d):
-		os.makedirs(d)
-
-def saveCanv(var, canv, directory, append=None, rootFile=False):
-	name = var
-	if append:
-		name = name + "_" + append
-
-	ensure_dir(directory)
-	canv.SaveAs(os.path.join(directory, outputname(name) + ".png")) 
-	ensure_dir(directory + "/pdf")
-	canv.SaveAs(os.path.join(directory, "pdf", outputname(name) + ".pdf"))
-	if rootFile:
-		ensure_dir(directory + "/root")
-		canv.SaveAs(os.path.join(directory, "root", outputname(name) + ".root"))
-
-###############################
-
-def plotVarDistribution(var, sigHist, bkgHistList):
-	sigHist.SetLineColor(kRed + 1)
-	sigHist.SetLineWidth(3)
-
-	bkgHist = None
-	for hist in bkgHistList:
-		if not bkgHist:
-			bkgHist = hist.Clone()
-		else:
-			bkgHist.Add(hist)
-
-	bkgHist.SetLineColor(kBlue + 2)
-	bkgHist.SetLineWidth(3)
-
-	leg = TLegend(0.7, 0.7, 0.9, 0.9)
-	leg.SetFillColor(kWhite)
-	leg.AddEntry(sigHist, "signal", "L")
-	leg.AddEntry(bkgHist, "background", "L")
-
-	stack = THStack()
-	stack.Add(sigHist, "hist")
-	stack.Add(bkgHist, "hist")
-	stack.SetTitle(";" + var + "; # events")
-
-	c = TCanvas("plotVar", "", 600, 600)
-	c.SetLogy()
-	stack.Draw("nostack")
-	leg.Draw("same")
-
-	saveCanv(var, c, "plots")
-
-def plotRating(var, title, graph):
-	graph.SetLineWidth(3)
-	graph.SetTitle(";" + var + ";" + title)
-
-	c = TCanvas("plotRating", "", 600, 600)
-	graph.Draw("al")
-
-	saveCanv(var, c, "plots", "rat")
-
 ###############################
 
 def calcIntegral(sigHist, bkgHistList, start, end):
@@ -98,13 +36,12 @@ def calcBkgIntegrals(bkgHistList, start, end):
 	return bkg_nEventsList
 
 def calcIntegralError(sigHist, bkgHistList, start, end):
-	sig_error = Double()
-	bkg_error = Double()
 	totbkg_error = 0
-	sig_nEvents = sigHist.IntegralAndError(start, end,sig_error)
+	sig_nEvents, sig_error = sigHist.integralAndError(start, end)
 	bkg_nEvents = 0
 	for bkgHist in bkgHistList:
-		bkg_nEvents += bkgHist.IntegralAndError(start, end, bkg_error)
+		nEvents, bkg_error = bkgHist.integralAndError(start, end)
+		bkg_nEvents += nEvents
 		totbkg_error += bkg_error*bkg_error
 	totbkg_error = sqrt(totbkg_error)
 	if sig_nEvents==0 or bkg_nEvents==0:
@@ -133,10 +70,17 @@ def initCutFinder(finder, opts, signal, backgrounds):
 	finder.lumi = opts.lumi
 	finder.method = opts.method
 	finder.includeMCstat = opts.includeMCstat
+	finder.scanMode = opts.scanMode
+	finder.unbinnedPoints = opts.unbinnedPoints
+	finder.bootstrapReplicas = opts.bootstrapReplicas
 
 ###############################
 
-CutResult = namedtuple("CutResult", "cutValue rating sigHist bkgHist nEvents_sig nEvents_bkg")
+CutResult = namedtuple("CutResult", "cutValue rating sigHist bkgHist nEvents_sig nEvents_bkg cutSpread ratingSpread")
+CutResult.__new__.__defaults__ = (None, None) # the spread is only known with bootstrap replicas
+CutHistograms = namedtuple("CutHistograms", "sigHist sigHistMC bkgHistList bkgHistMCList")
+SampleEvents = namedtuple("SampleEvents", "values weights mcWeights replicaWeights")
+SampleEvents.__new__.__defaults__ = (None,) # (nReplicas, nEvents) with bootstrap replicas
 
 ###############################
 
@@ -154,54 +98,167 @@ class CutFinder(object):
 		self.lumi = 10e3
 		self.method = "sig"
 		self.enable_plots = False
+		self.plotter = None # if set, the plots are handed to this PlotPool (or PlotCollector) instead of being made directly
 		self.damp_func = None
 		self.includeMCstat = False
-
-	def getOptimalCut(self, var, nbins, minV, maxV, lower_cut, iteration=0):
-		sigHist = utils.getHistogram(var, nbins, minV, maxV, self.signal, self.event_weight, self.signal_scale, "sig", self.preselection, self.lumi)
-		sigHistMC = utils.getHistogram(var, nbins, minV, maxV, self.signal, self.event_weight, self.signal_scale, "sigMC", self.preselection, self.lumi, nMCEvents=True)
-		bkgHistList = []
-		bkgHistMCList = []
-
+		self.cache = None
+		self.scanMode = "loop"
+		self.unbinnedPoints = None # maximum number of cuts evaluated by the unbinned scan
+		self.nFillProcesses = 1
+		self.maxMemory = None # in bytes, the chains are read in chunks of entries such that the buffers stay below this size
+		self.histCacheDir = None
+		self.histCacheSize = 1e9
+		self.appliedCuts = "" # cuts applied to the chains by entry lists
+		self.fineBins = None
+		self.bootstrapReplicas = 0 # number of poisson bootstrap replicas filled together with the histograms
+		self.bootstrapSeed = 1
+		self.baseHists = {} # (sample name, var, min, max) -> fine histograms for the current selection
+
+	def fillHistograms(self, binnings):
+		# fill the histograms of all variables with a single pass over each chain
 		# if background scale list is not initialized, just fill it with 1.
 		if not self.backgrounds_scale:
 			for i in xrange(len(self.backgrounds)):
 				self.backgrounds_scale.append(1.0)
 
+		bkgHists = []
+		if self.cache:
+			# the events are taken from memory, the cuts are known by the cache
+			selection = self.cache.selection
+			sigHists = self.cache.fillHistograms(binnings, self.cache.signal, selection.signal, "sig", self.lumi, self.getReplicas())
+			for i, bkgColumns in enumerate(self.cache.backgrounds):
+				bkgHists.append(self.cache.fillHistograms(binnings, bkgColumns, selection.backgrounds[i], "bkg_" + str(i), self.lumi, self.getReplicas()))
+		else:
+			sigHists = self.fillSample(binnings, self.signal, self.signal_scale, "sig")
+			for i, bkgTree in enumerate(self.backgrounds):
+				bkgHists.append(self.fillSample(binnings, bkgTree, self.backgrounds_scale[i], "bkg_" + str(i)))
+
+		hists = {}
+		for var in binnings:
+			sigHist, sigHistMC = sigHists[var]
+			hists[var] = CutHistograms(sigHist, sigHistMC, [h[var][0] for h in bkgHists], [h[var][1] for h in bkgHists])
+		return hists
+
+	def reopenChains(self):
+		# new chains for the same files (and entry lists), e.g. for a forked worker process
+		self.signal = utils.cloneChain(self.signal)
+		self.backgrounds = [utils.cloneChain(bkgTree) for bkgTree in self.backgrounds]
+
+	def addCut(self, var, lower_cut, cutValue, step):
+		# the cut is evaluated once, afterwards only the surviving events are looked at
+		self.baseHists = {}
+		if self.cache:
+			self.cache.addCut(var, lower_cut, cutValue)
+			return
+
+		cutString = " && " + utils.cutExpression(var, lower_cut, cutValue)
+		self.appliedCuts += cutString
+		selection = "(" + str(self.preselection) + ")" + cutString
+		utils.applyCut(self.signal, selection, "elist_sig_step" + str(step))
 		for i, bkgTree in enumerate(self.backgrounds):
-			bkgHistList.append(utils.getHistogram(var, nbins, minV, maxV, bkgTree, self.event_weight, self.backgrounds_scale[i], "bkg_" + str(i), self.preselection, self.lumi))
-			bkgHistMCList.append(utils.getHistogram(var, nbins, minV, maxV, bkgTree, self.event_weight, self.backgrounds_scale[i], "bkgMC_" + str(i), self.preselection, self.lumi, nMCEvents=True))
+			utils.applyCut(bkgTree, selection, "elist_bkg_" + str(i) + "_step" + str(step))
+
+	def fillSample(self, binnings, tree, extra_weight, name):
+		if not self.fineBins:
+			return self.fillSampleDirect(binnings, tree, extra_weight, name)
+
+		# each variable is filled only once with fineBins bins for the current selection,
+		# the requested binnings are derived by rebinning (only possible if nBins divides fineBins)
+		rebinned = {}
+		direct = {}
+		for var, (nBins, minV, maxV) in binnings.iteritems():
+			if self.fineBins % nBins == 0:
+				rebinned[var] = (nBins, minV, maxV)
+			else:
+				direct[var] = (nBins, minV, maxV)
+
+		missing = {}
+		for var, (nBins, minV, maxV) in rebinned.iteritems():
+			if (name, var, minV, maxV) not in self.baseHists:
+				missing[var] = (self.fineBins, minV, maxV)
+		if missing:
+			for var, baseHists in self.fillSampleDirect(missing, tree, extra_weight, name).iteritems():
+				self.baseHists[(name, var) + missing[var][1:]] = baseHists
+
+		hists = {}
+		if direct:
+			hists = self.fillSampleDirect(direct, tree, extra_weight, name)
+		for var, (nBins, minV, maxV) in rebinned.iteritems():
+			ngroup = self.fineBins / nBins
+			hists[var] = tuple(utils.rebinHistogram(base, ngroup) for base in self.baseHists[(name, var, minV, maxV)])
+
+		return hists
+
+	def getReplicas(self):
+		if self.bootstrapReplicas > 0:
+			return self.bootstrapReplicas, self.bootstrapSeed
+		return None
+
+	def fillSampleDirect(self, binnings, tree, extra_weight, name):
+		# the bootstrap replicas are not stored in the histogram cache
+		if self.histCacheDir and not self.getReplicas():
+			# histograms which were already filled in a previous run are read from disk
+			histCache = HistogramCache(self.histCacheDir, self.histCacheSize)
+			return histCache.fillHistograms(binnings, tree, self.event_weight, extra_weight, name, self.preselection, self.lumi, self.appliedCuts, self.nFillProcesses, self.maxMemory)
+		return utils.fillHistograms(binnings, tree, self.event_weight, extra_weight, name, self.preselection, self.lumi, self.nFillProcesses, self.maxMemory, self.getReplicas())
+
+	def plot(self, iteration, plot):
+		if self.plotter:
+			self.plotter.add(iteration, plot)
+		else:
+			renderPlots([plot], "plots")
 
+	def getOptimalCut(self, var, nbins, minV, maxV, lower_cut, iteration=0, hists=None):
+		# the histograms can be given, when they are filled together with other variables
+		if not hists:
+			with profiling.timer("fillHistograms"):
+				hists = self.fillHistograms({var: (nbins, minV, maxV)})[var]
+		sigHist, sigHistMC, bkgHistList, bkgHistMCList = hists
 
 		if self.enable_plots:
-			plotVarDistribution(var, sigHist, bkgHistList)
+			self.plot(iteration, Plot("var", var, (sigHist, bkgHistList)))
+
+		if lower_cut == utils.WINDOW:
+			return self.getOptimalWindow(var, nbins, minV, maxV, iteration, hists)
+		if self.scanMode == "unbinned":
+			return self.getOptimalCutUnbinned(var, minV, maxV, lower_cut, iteration, hists)
 
 		bestCut = None
 		bestBin = None
 		nEvents_sig = -1
 		nEvents_bkg = -1
-		graph = TGraph()
-		for ibin in xrange(nbins):
-			rating = self.calcCutRating(sigHist, bkgHistList, lower_cut, ibin)
-			if lower_cut:
-				graph.SetPoint(ibin, sigHist.GetBinLowEdge(ibin+1), rating)
+		graph = [] # (cut value, rating) for the plot
+		with profiling.timer("cut scan"):
+			if self.scanMode == "prefix":
+				ratings, bestBin, bestCut, nEvents_sig, nEvents_bkg = self.scanCumulative(sigHist, sigHistMC, bkgHistList, bkgHistMCList, lower_cut, iteration)
+				if self.enable_plots:
+					for ibin in xrange(nbins):
+						if lower_cut:
+							graph.append((sigHist.GetBinLowEdge(ibin+1), ratings[ibin]))
+						else:
+							graph.append((sigHist.GetBinLowEdge(ibin), ratings[ibin]))
 			else:
-				graph.SetPoint(ibin, sigHist.GetBinLowEdge(ibin), rating)
-			
-			if not bestCut or self.method.compare(rating, bestCut):
-				if not self.bkgsMCboundary:
-					for i in xrange(len(self.backgrounds)):
-						self.bkgsMCboundary.append(10.)
-				if (self.checkMCStatistics(sigHistMC, bkgHistMCList, self.sigMCboundary, self.bkgsMCboundary, lower_cut, ibin) and self.doDamping(bkgHistList, lower_cut, ibin, iteration)):
-					bestCut = rating
-					bestBin = ibin
+				for ibin in xrange(nbins):
+					rating = self.calcCutRating(sigHist, bkgHistList, lower_cut, ibin)
 					if lower_cut:
-						nEvents_sig, nEvents_bkg = calcIntegral(sigHist, bkgHistList, 0, ibin)
+						graph.append((sigHist.GetBinLowEdge(ibin+1), rating))
 					else:
-						nEvents_sig, nEvents_bkg = calcIntegral(sigHist, bkgHistList, ibin, sigHist.GetNbinsX()+1)
-					
+						graph.append((sigHist.GetBinLowEdge(ibin), rating))
+			
+					if not bestCut or self.method.compare(rating, bestCut):
+						if not self.bkgsMCboundary:
+							for i in xrange(len(self.backgrounds)):
+								self.bkgsMCboundary.append(10.)
+						if (self.checkMCStatistics(sigHistMC, bkgHistMCList, self.sigMCboundary, self.bkgsMCboundary, lower_cut, ibin) and self.doDamping(bkgHistList, lower_cut, ibin, iteration)):
+							bestCut = rating
+							bestBin = ibin
+							if lower_cut:
+								nEvents_sig, nEvents_bkg = calcIntegral(sigHist, bkgHistList, 0, ibin)
+							else:
+								nEvents_sig, nEvents_bkg = calcIntegral(sigHist, bkgHistList, ibin, sigHist.GetNbinsX()+1)
+
 		if self.enable_plots:
-			plotRating(var, self.method.title, graph)
+			self.plot(iteration, Plot("rating", var, (self.method.title, graph)))
 
 		if not bestBin:
 			bestBin = 0
@@ -213,19 +270,221 @@ class CutFinder(object):
 		if ratingRounded:
 			optimalCutValue = cutValue
 			optimalRating = ratingRounded
-		elif lower_cut:
-			optimalCutValue = sigHist.GetBinLowEdge(bestBin+1)
-			optimalRating = bestCut
 		else:
-			optimalCutValue = sigHist.GetBinLowEdge(bestBin)
+			optimalCutValue = self.getBinCutValue(sigHist, bestBin, lower_cut)
 			optimalRating = bestCut
 		
 		# check that if the cut Value is lower than min/larger than max the bin should be under/overflow bin
 		# the cut value should be set to min or max value of this variable
 		optimalCutValue = self.checkCutValue(optimalCutValue, bestBin, nbins, minV, maxV, lower_cut)
 
+		cutSpread, ratingSpread = self.getBootstrapSpread(hists, nbins, minV, maxV, lower_cut, iteration)
+
+		bkgHist = addHists(bkgHistList)
+		return CutResult(optimalCutValue, optimalRating, sigHistMC, bkgHist, nEvents_sig, nEvents_bkg, cutSpread, ratingSpread)
+
+	def getOptimalCutUnbinned(self, var, minV, maxV, lower_cut, iteration, hists):
+		# the histograms are only used for the output
+		sigHist, sigHistMC, bkgHistList, bkgHistMCList = hists
+		with profiling.timer("cut scan"):
+			cuts, ratings, optimalCutValue, optimalRating, nEvents_sig, nEvents_bkg, cutSpread, ratingSpread = self.scanUnbinned(var, minV, maxV, lower_cut, iteration)
+
+		if self.enable_plots:
+			graph = zip(cuts, ratings)
+			self.plot(iteration, Plot("rating", var, (self.method.title, graph)))
+
+		if optimalCutValue is None:
+			# no cut fulfills the requirements, the cut is set to the edge of the range
+			optimalCutValue = maxV if lower_cut else minV
+
+		bkgHist = addHists(bkgHistList)
+		return CutResult(optimalCutValue, optimalRating, sigHistMC, bkgHist, nEvents_sig, nEvents_bkg, cutSpread, ratingSpread)
+
+	def getOptimalWindow(self, var, nbins, minV, maxV, iteration, hists):
+		# all windows of bins inside [minV, maxV] are rated at once from cumulative sums,
+		# the cut value is the pair (low, high) of the best window
+		sigHist, sigHistMC, bkgHistList, bkgHistMCList = hists
+		with profiling.timer("cut scan"):
+			sig, sig_error2 = utils.getBinArrays(sigHist)
+			sigMC = utils.getBinArrays(sigHistMC)[0]
+			bkgArrays = [utils.getBinArrays(hist) for hist in bkgHistList]
+			bkgs = numpy.array([contents for contents, error2 in bkgArrays])
+			bkg_error2 = numpy.array([error2 for contents, error2 in bkgArrays]).sum(axis=0)
+			bkgsMC = numpy.array([utils.getBinArrays(hist)[0] for hist in bkgHistMCList])
+
+			first, last = cutScan.windowBins(nbins)
+			sig_nEvents = cutScan.windowSums(sig, first, last)
+			bkg_nEventsList = cutScan.windowSums(bkgs, first, last)
+			ratings, valid = self.rateCuts(sig_nEvents, cutScan.windowSums(sig_error2, first, last), bkg_nEventsList, cutScan.windowSums(bkg_error2, first, last),
+					cutScan.windowSums(sigMC, first, last), cutScan.windowSums(bkgsMC, first, last), bkgs.sum(axis=1), iteration)
+
+		if self.enable_plots:
+			self.plot(iteration, Plot("window", var, (self.method.title, nbins, minV, maxV, first, last, ratings)))
+
+		best = self.method.best(ratings, valid)
 		bkgHist = addHists(bkgHistList)
-		return CutResult(optimalCutValue, optimalRating, sigHistMC, bkgHist, nEvents_sig, nEvents_bkg)
+		cutSpread, ratingSpread = self.getBootstrapSpread(hists, nbins, minV, maxV, utils.WINDOW, iteration)
+		if best is None:
+			# no window fulfills the requirements, the whole range is taken
+			return CutResult((minV, maxV), None, sigHistMC, bkgHist, -1, -1, cutSpread, ratingSpread)
+
+		window = (sigHist.GetBinLowEdge(int(first[best])), sigHist.GetBinLowEdge(int(last[best]) + 1))
+		return CutResult(window, float(ratings[best]), sigHistMC, bkgHist, sig_nEvents[best], bkg_nEventsList[:, best].sum(), cutSpread, ratingSpread)
+
+	def scanCumulative(self, sigHist, sigHistMC, bkgHistList, bkgHistMCList, lower_cut, iteration):
+		# evaluates all cut bins at once from cumulative sums, instead of integrating the histograms for every bin
+		ratings, valid, sig_nEvents, bkg_nEvents = self.rateCumulative(sigHist, sigHistMC, bkgHistList, bkgHistMCList, lower_cut, iteration)
+
+		bestBin = self.method.best(ratings, valid)
+		if bestBin is None:
+			return ratings, None, None, -1, -1
+		return ratings, bestBin, float(ratings[bestBin]), sig_nEvents[bestBin], bkg_nEvents[bestBin]
+
+	def rateCumulative(self, sigHist, sigHistMC, bkgHistList, bkgHistMCList, lower_cut, iteration):
+		# ratings, validity and expected events of all cut bins
+		sig, sig_error2 = utils.getBinArrays(sigHist)
+		sigMC = utils.getBinArrays(sigHistMC)[0]
+		bkgArrays = [utils.getBinArrays(hist) for hist in bkgHistList]
+		bkgs = numpy.array([contents for contents, error2 in bkgArrays])
+		bkg_error2 = numpy.array([error2 for contents, error2 in bkgArrays]).sum(axis=0)
+		bkgsMC = numpy.array([utils.getBinArrays(hist)[0] for hist in bkgHistMCList])
+
+		sig_nEvents = cutScan.cumulative(sig, lower_cut)
+		bkg_nEventsList = cutScan.cumulative(bkgs, lower_cut)
+		ratings, valid = self.rateCuts(sig_nEvents, cutScan.cumulative(sig_error2, lower_cut), bkg_nEventsList, cutScan.cumulative(bkg_error2, lower_cut),
+				cutScan.cumulative(sigMC, lower_cut), cutScan.cumulative(bkgsMC, lower_cut), bkgs.sum(axis=1), iteration)
+		return ratings, valid, sig_nEvents, bkg_nEventsList.sum(axis=0)
+
+	def getEvents(self, var):
+		# values, expected event weights and MC weights of the selected events, for the signal and each background
+		# with bootstrap replicas also their replica weights (the same as for the histograms of the cache, or from the entry numbers)
+		replicas = self.getReplicas()
+		events = []
+		if self.cache:
+			selection = self.cache.selection
+			samples = [(self.cache.signal, selection.signal, "sig")] + [(sample, indices, "bkg_" + str(i)) for i, (sample, indices) in enumerate(zip(self.cache.backgrounds, selection.backgrounds))]
+			for sample, indices, name in samples:
+				weights = sample.weights[indices]
+				replicaWeights = self.cache.getReplicaWeights(sample, name, replicas)[:, indices] if replicas else None
+				events.append((sample.columns[var][indices], sample.eventWeights[indices] * weights * self.lumi, weights, replicaWeights))
+		else:
+			# the cuts are applied by the entry lists of the chains
+			trees = [(self.signal, self.signal_scale, "sig")] + [(tree, scale, "bkg_" + str(i)) for i, (tree, scale) in enumerate(zip(self.backgrounds, self.backgrounds_scale))]
+			for tree, extra_weight, name in trees:
+				expressions = [var, str(self.event_weight)] + ([utils.ENTRY] if replicas else [])
+				columns, weights = utils.readColumnsChunked(tree, expressions, str(extra_weight) + "*(" + str(self.preselection) + ")", self.maxMemory)
+				replicaWeights = bootstrap.replicaWeights(columns[2], replicas[0], name, replicas[1]) if replicas else None
+				events.append((columns[0], columns[1] * weights * self.lumi, weights, replicaWeights))
+
+		# events where the variable is not defined never pass a cut
+		samples = []
+		for values, eventWeights, weights, replicaWeights in events:
+			defined = values != utils.MISSING_VALUE
+			samples.append(SampleEvents(values[defined], eventWeights[defined], weights[defined], None if replicaWeights is None else replicaWeights[:, defined]))
+		return samples
+
+	def scanUnbinned(self, var, minV, maxV, lower_cut, iteration):
+		# evaluates the cuts between all distinct values of the selected events, the result does not depend on a binning
+		events = self.getEvents(var)
+		cuts = cutScan.getCandidateCuts([sample.values for sample in events], minV, maxV, self.unbinnedPoints)
+
+		sums = [cutScan.passingSums(sample.values, [sample.weights, sample.weights**2, sample.mcWeights], cuts, lower_cut) for sample in events]
+		sig_nEvents, sig_error2, sig_nMCEvents = sums[0]
+		bkg_nEventsList = numpy.array([bkgSums[0] for bkgSums in sums[1:]])
+		bkg_error2 = numpy.array([bkgSums[1] for bkgSums in sums[1:]]).sum(axis=0)
+		bkg_nMCEventsList = numpy.array([bkgSums[2] for bkgSums in sums[1:]])
+		totalBkgEventsList = numpy.array([sample.weights.sum() for sample in events[1:]])
+
+		ratings, valid = self.rateCuts(sig_nEvents, sig_error2, bkg_nEventsList, bkg_error2, sig_nMCEvents, bkg_nMCEventsList, totalBkgEventsList, iteration)
+		cutSpread, ratingSpread = self.getUnbinnedSpread(events, cuts, sig_error2, bkg_error2, sig_nMCEvents, bkg_nMCEventsList, lower_cut, iteration)
+
+		best = self.method.best(ratings, valid)
+		if best is None:
+			return cuts, ratings, None, None, -1, -1, cutSpread, ratingSpread
+		return cuts, ratings, float(cuts[best]), float(ratings[best]), sig_nEvents[best], bkg_nEventsList[:, best].sum(), cutSpread, ratingSpread
+
+	def getUnbinnedSpread(self, events, cuts, sig_error2, bkg_error2, sig_nMCEvents, bkg_nMCEventsList, lower_cut, iteration):
+		# the same as getBootstrapSpread for the cuts of the unbinned scan, the replicas are the first axis of the sums
+		if any(sample.replicaWeights is None for sample in events):
+			return None, None
+
+		with profiling.timer("bootstrap"):
+			# the MC statistics and the uncertainties are taken from the nominal sums
+			replicaSums = [cutScan.passingSums(sample.values, [sample.replicaWeights * sample.weights], cuts, lower_cut)[0] for sample in events]
+			bkg_nEventsList = numpy.array(replicaSums[1:])
+			totalBkgEventsList = numpy.array([(sample.replicaWeights * sample.weights).sum(axis=-1) for sample in events[1:]])
+			ratings, valid = self.rateCuts(replicaSums[0], sig_error2, bkg_nEventsList, bkg_error2, sig_nMCEvents, bkg_nMCEventsList, totalBkgEventsList, iteration)
+			valid = numpy.broadcast_to(valid, ratings.shape)
+
+			bestCuts = []
+			bestRatings = []
+			for replica in xrange(len(ratings)):
+				best = self.method.best(ratings[replica], valid[replica])
+				if best is None:
+					continue
+				bestCuts.append(float(cuts[best]))
+				bestRatings.append(float(ratings[replica, best]))
+
+		return bootstrap.spread(bestCuts), bootstrap.spread(bestRatings)
+
+	def getBootstrapSpread(self, hists, nbins, minV, maxV, lower_cut, iteration):
+		# standard deviation of the optimal cut value and rating over the bootstrap replicas,
+		# all replicas are rated at once, they are the first axis of the arrays
+		sigHist, sigHistMC, bkgHistList, bkgHistMCList = hists
+		if sigHist.replicas is None or any(hist.replicas is None for hist in bkgHistList):
+			return None, None
+
+		with profiling.timer("bootstrap"):
+			sig = sigHist.replicas
+			bkgs = numpy.array([hist.replicas for hist in bkgHistList])
+			# the MC statistics and the uncertainties are taken from the nominal histograms
+			sig_error2 = utils.getBinArrays(sigHist)[1]
+			bkg_error2 = numpy.array([utils.getBinArrays(hist)[1] for hist in bkgHistList]).sum(axis=0)
+			sigMC = utils.getBinArrays(sigHistMC)[0]
+			bkgsMC = numpy.array([utils.getBinArrays(hist)[0] for hist in bkgHistMCList])
+
+			if lower_cut == utils.WINDOW:
+				first, last = cutScan.windowBins(nbins)
+				sums = lambda contents: cutScan.windowSums(contents, first, last)
+			else:
+				sums = lambda contents: cutScan.cumulative(contents, lower_cut)
+			ratings, valid = self.rateCuts(sums(sig), sums(sig_error2), sums(bkgs), sums(bkg_error2), sums(sigMC), sums(bkgsMC), bkgs.sum(axis=-1), iteration)
+			valid = numpy.broadcast_to(valid, ratings.shape)
+
+			cuts = []
+			bestRatings = []
+			for replica in xrange(len(ratings)):
+				best = self.method.best(ratings[replica], valid[replica])
+				if best is None:
+					continue
+				if lower_cut == utils.WINDOW:
+					cuts.append((sigHist.GetBinLowEdge(int(first[best])), sigHist.GetBinLowEdge(int(last[best]) + 1)))
+				else:
+					cuts.append(self.checkCutValue(self.getBinCutValue(sigHist, best, lower_cut), best, nbins, minV, maxV, lower_cut))
+				bestRatings.append(float(ratings[replica, best]))
+
+		return bootstrap.spread(cuts), bootstrap.spread(bestRatings)
+
+	def rateCuts(self, sig_nEvents, sig_error2, bkg_nEventsList, bkg_error2, sig_nMCEvents, bkg_nMCEventsList, totalBkgEventsList, iteration):
+		# ratings of a set of cuts and whether the cuts fulfill the MC statistics and damping requirements,
+		# the background arrays are stacked along the first axis (further axes, e.g. bootstrap replicas, are kept)
+		bkg_nEvents = bkg_nEventsList.sum(axis=0)
+
+		uncertainty = self.flatBkgUncertainty
+		if self.includeMCstat:
+			sig_relerror, bkg_relerror = cutScan.relativeErrors(sig_nEvents, sig_error2, bkg_nEvents, bkg_error2)
+			uncertainty = numpy.sqrt(pow(self.flatBkgUncertainty,2) + sig_relerror**2 + bkg_relerror**2)
+
+		with profiling.timer("rating calculation"):
+			ratings = self.method.calc_batch(sig_nEvents, bkg_nEvents, uncertainty)
+
+		if not self.bkgsMCboundary:
+			for i in xrange(len(self.backgrounds)):
+				self.bkgsMCboundary.append(10.)
+		valid = cutScan.checkMCStatistics(sig_nMCEvents, bkg_nMCEventsList, self.sigMCboundary, self.bkgsMCboundary)
+		if self.damp_func:
+			valid = valid & cutScan.doDamping(bkg_nEventsList, totalBkgEventsList, self.damp_func(iteration))
+		return ratings, valid
 
 	def calcCutRating(self, sigHist, bkgHistList, lower_cut, ibin):
 		sig_nEvents = 0
@@ -233,17 +492,20 @@ class CutFinder(object):
 		if lower_cut:
 			begin = 0
 			sig_nEvents,  bkg_nEvents  = calcIntegral(sigHist, bkgHistList, begin, ibin)
-			sig_relerror, bkg_relerror = calcIntegralError(sigHist, bkgHistList, begin, ibin)
+			with profiling.timer("calcIntegralError"):
+				sig_relerror, bkg_relerror = calcIntegralError(sigHist, bkgHistList, begin, ibin)
 		else:
 			end = sigHist.GetNbinsX()+1
 			sig_nEvents,  bkg_nEvents  = calcIntegral(sigHist, bkgHistList, ibin, end)
-			sig_relerror, bkg_relerror = calcIntegralError(sigHist, bkgHistList, ibin, end)
+			with profiling.timer("calcIntegralError"):
+				sig_relerror, bkg_relerror = calcIntegralError(sigHist, bkgHistList, ibin, end)
 
 		# TODO: fix methods which are lumi depened
 		uncertainty = self.flatBkgUncertainty
 		if self.includeMCstat:
 			uncertainty = sqrt(pow(self.flatBkgUncertainty,2)+pow(sig_relerror,2)+pow(bkg_relerror,2))
-		return self.method.calc(sig_nEvents, bkg_nEvents, uncertainty)
+		with profiling.timer("rating calculation"):
+			return self.method.calc(sig_nEvents, bkg_nEvents, uncertainty)
 
 	def doDamping(self, bkgHistList, lower_cut, ibin, iteration):
 		if not self.damp_func:
@@ -285,6 +547,12 @@ class CutFinder(object):
 				return False
 		return True
 
+	def getBinCutValue(self, hist, ibin, lower_cut):
+		# the edge of the cut bin ibin, as used by calcCutRating
+		if lower_cut:
+			return hist.GetBinLowEdge(ibin+1)
+		return hist.GetBinLowEdge(ibin)
+
 	def getRoundedCutValue(self, binC, hist, maxV, lower_cut):
 		value = None
 		if lower_cut:
@@ -306,7 +574,7 @@ class CutFinder(object):
 		return value
 
 	def checkRoundingEffects(self, sigHist, bkgHistList, cutValue, rating, lower_cut):
-		binC = sigHist.GetXaxis().FindBin(cutValue)
+		binC = sigHist.FindBin(cutValue)
 		ratingRounded = self.calcCutRating(sigHist, bkgHistList, lower_cut, binC)
 		if abs(rating - ratingRounded) / rating > 0.1:
 			print "ERROR: rounding influences the ratings too much"
@@ -350,7 +618,12 @@ def parse_options():
 		parser.add_argument("--flatBkgUncertainty", default=None, help="the background uncertainty")
 		parser.add_argument("--nbins", default=100, help="the number of bins which are used to define the optimal cut")
 		parser.add_argument("--lower-cut", action="store_true", help="events survive when their value is lower than the cut value")
+		parser.add_argument("--window", action="store_true", help="search for a window (low, high) instead of a single cut value")
 		parser.add_argument("--includeMCstat", action="store_true", help="Consider MC statistics in the uncertainty")
+		parser.add_argument("--scan-mode", dest="scanMode", choices=["loop", "prefix", "unbinned"], default="loop", help="integrate the histograms for each bin (loop), use cumulative sums for all bins at once (prefix) or scan the sorted events without binning (unbinned)")
+		parser.add_argument("--unbinned-points", dest="unbinnedPoints", type=int, default=None, help="maximum number of cut values evaluated by the unbinned scan, taken at quantiles of the events")
+
+		parser.add_argument("--bootstrap-replicas", dest="bootstrapReplicas", type=int, default=0, help="number of poisson bootstrap replicas used to estimate the spread of the optimal cut and rating")
 
 		parser.add_argument("var", help="the variable name which should be analysed (need to be stored in the trees)")
 		parser.add_argument("min", type=float, help="the minimum value for the variable")
@@ -365,7 +638,7 @@ def parse_options():
 ###############################
 
 def main():
-	gROOT.SetBatch(True)
+	lazyRoot.batchMode()
 	opts = parse_options()
 
 	signal = utils.load_chain([opts.signal], opts.tree_name, print_files=True)
@@ -374,11 +647,17 @@ def main():
 	for bkg in opts.bkgs:
 		backgrounds.append(utils.load_chain([bkg], opts.tree_name, print_files=True))
 
+	for tree in [signal] + backgrounds:
+		utils.pruneBranches(tree, [opts.var, opts.event_weight, opts.preselection], print_branches=True)
+
 	finder = CutFinder()
 	initCutFinder(finder, opts, signal, backgrounds)
 
-	result = finder.getOptimalCut(opts.var, opts.nbins, opts.min, opts.max, opts.lower_cut)
+	lower_cut = utils.WINDOW if opts.window else opts.lower_cut
+	result = finder.getOptimalCut(opts.var, opts.nbins, opts.min, opts.max, lower_cut)
 	print result.cutValue, result.rating
+	if result.cutSpread is not None:
+		print "spread over", opts.bootstrapReplicas, "bootstrap replicas:", result.cutSpread, result.ratingSpread
 
 ###############################
 
@@ -0,0 +1,141 @@
+import os
+import hashlib
+
+from lazyRoot import ROOT
+import histogram
+import utils
+
+###############################
+
+def getInputFiles(tree):
+	# tree name, file name and modification time of every file of the chain
+	files = []
+	for element in tree.GetListOfFiles():
+		filename = element.GetTitle()
+		mtime = None
+		if os.path.exists(filename):
+			mtime = os.path.getmtime(filename)
+		files.append((element.GetName(), filename, mtime))
+	return files
+
+def removeFile(path):
+	# the ranking workers share the cache directory, another process may have removed the file already
+	try:
+		os.remove(path)
+	except OSError:
+		pass
+
+###############################
+
+class HistogramCache(object):
+	# stores the filled histograms on disk, the file name is a hash of everything used to fill them
+	# the histograms are stored without the luminosity, such that it can be changed without filling them again
+	def __init__(self, directory, maxSize):
+		self.directory = directory
+		self.maxSize = maxSize # in bytes, the least recently used histograms are removed above this size
+
+	def getKey(self, var, binning, inputFiles, event_weight, extra_weight, preselection, selection):
+		inputs = (var, tuple(binning), inputFiles, str(event_weight), str(extra_weight), str(preselection), selection)
+		return hashlib.sha1(repr(inputs)).hexdigest()
+
+	def getPath(self, key):
+		return os.path.join(self.directory, key + ".root")
+
+	def load(self, key):
+		path = self.getPath(key)
+		if not os.path.exists(path):
+			return None
+
+		previous = ROOT.gDirectory.GetPath()
+		rFile = ROOT.TFile.Open(path)
+		hist = rFile.Get("hist") if rFile else None
+		histMC = rFile.Get("histMC") if rFile else None
+		if hist and histMC:
+			hist = histogram.fromROOT(hist)
+			histMC = histogram.fromROOT(histMC)
+		if rFile:
+			rFile.Close()
+		ROOT.gROOT.cd(previous)
+
+		if not (hist and histMC):
+			print "WARNING: removing broken histogram cache file", path
+			removeFile(path)
+			return None
+
+		# the access time is used to remove the least recently used files
+		try:
+			os.utime(path, None)
+		except OSError:
+			pass # removed by another process in the meantime, the histograms are already read
+		return hist, histMC
+
+	def store(self, key, hist, histMC):
+		if not os.path.exists(self.directory):
+			try:
+				os.makedirs(self.directory)
+			except OSError:
+				# created by another process at the same time
+				if not os.path.isdir(self.directory):
+					raise
+		path = self.getPath(key)
+
+		# written to a temporary file first, such that no incomplete file is read by another job
+		previous = ROOT.gDirectory.GetPath()
+		# the name of the temporary file is unique per process, several workers may store the same histograms
+		tmpPath = path + "." + str(os.getpid()) + ".tmp"
+		rFile = ROOT.TFile(tmpPath, "RECREATE")
+		rFile.WriteTObject(histogram.toROOT(hist), "hist")
+		rFile.WriteTObject(histogram.toROOT(histMC), "histMC")
+		rFile.Close()
+		ROOT.gROOT.cd(previous)
+		os.rename(tmpPath, path)
+
+	def evict(self):
+		entries = []
+		totalSize = 0
+		for filename in os.listdir(self.directory):
+			if not filename.endswith(".root"):
+				continue
+			path = os.path.join(self.directory, filename)
+			try:
+				stat = os.stat(path)
+			except OSError:
+				continue # removed by another process
+			entries.append((stat.st_mtime, stat.st_size, path))
+			totalSize += stat.st_size
+
+		for mtime, size, path in sorted(entries):
+			if totalSize <= self.maxSize:
+				break
+			removeFile(path)
+			totalSize -= size
+
+	def fillHistograms(self, binnings, tree, event_weight, extra_weight, name, preselection, lumi, selection="", nProcesses=1, maxMemory=None):
+		# same as utils.fillHistograms, only the variables which are not in the cache are filled
+		# selection: cuts which are applied to the tree by an entry list
+		inputFiles = tuple(getInputFiles(tree))
+		keys = dict((var, self.getKey(var, binning, inputFiles, event_weight, extra_weight, preselection, selection)) for var, binning in binnings.iteritems())
+
+		hists = {}
+		missing = {}
+		for var, binning in binnings.iteritems():
+			cached = self.load(keys[var])
+			if cached:
+				hist, histMC = cached
+				hist.SetName(name + "_" + utils.sanitise(var))
+				histMC.SetName(name + "MC_" + utils.sanitise(var))
+				hists[var] = cached
+			else:
+				missing[var] = binning
+
+		if missing:
+			filled = utils.fillHistograms(missing, tree, event_weight, extra_weight, name, preselection, 1., nProcesses, maxMemory)
+			for var, (hist, histMC) in filled.iteritems():
+				self.store(keys[var], hist, histMC)
+			hists.update(filled)
+			self.evict()
+
+		for hist, histMC in hists.itervalues():
+			hist.Scale(lumi)
+
+		return hists
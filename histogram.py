@@ -0,0 +1,140 @@
+import numpy
+
+from lazyRoot import ROOT
+
+###############################
+# one dimensional histogram on numpy arrays with the methods of TH1D used by the optimisation, such that the
+# cut scan, the ranking and the rating methods do not need ROOT; it is converted to a TH1D for the output and the plots
+# the bins are numbered as in ROOT: 0 is the underflow, 1 .. nBins the bins of [min, max), nBins+1 the overflow
+# replicas: optional contents (nReplicas, nBins+2) of the bootstrap replicas, filled with the event weights times the replica weights
+
+class Histogram(object):
+	def __init__(self, name, nBins, minV, maxV, contents=None, sumw2=None, replicas=None):
+		self.name = name
+		self.nBins = nBins
+		self.min = float(minV)
+		self.max = float(maxV)
+		self.contents = numpy.zeros(nBins + 2) if contents is None else numpy.array(contents, dtype=numpy.float64)
+		self.sumw2 = numpy.zeros(nBins + 2) if sumw2 is None else numpy.array(sumw2, dtype=numpy.float64)
+		self.replicas = None if replicas is None else numpy.array(replicas, dtype=numpy.float64)
+
+	def getBins(self, values):
+		# same bin numbers as TAxis::FindFixBin
+		# NaN is compared without warnings, it goes to the overflow
+		with numpy.errstate(invalid="ignore"):
+			position = numpy.floor(self.nBins * (values - self.min) / (self.max - self.min)) + 1
+			bins = numpy.clip(numpy.nan_to_num(position), 0, self.nBins + 1).astype(numpy.int64)
+			bins[values < self.min] = 0
+			bins[(values >= self.max) | numpy.isnan(values)] = self.nBins + 1
+		return bins
+
+	def FillN(self, n, values, weights):
+		values = numpy.asarray(values, dtype=numpy.float64)[:n]
+		weights = numpy.asarray(weights, dtype=numpy.float64)[:n]
+		bins = self.getBins(values)
+		self.contents += numpy.bincount(bins, weights, minlength=self.nBins + 2)
+		self.sumw2 += numpy.bincount(bins, weights**2, minlength=self.nBins + 2)
+
+	def fillReplicas(self, values, weights, replicaWeights):
+		# one bincount for all replicas, the replica r uses the bins r * (nBins+2) ...
+		nReplicas = len(replicaWeights)
+		bins = self.getBins(numpy.asarray(values, dtype=numpy.float64))
+		if self.replicas is None:
+			self.replicas = numpy.zeros((nReplicas, self.nBins + 2))
+		indices = (numpy.arange(nReplicas)[:, numpy.newaxis] * (self.nBins + 2) + bins[numpy.newaxis, :]).ravel()
+		self.replicas += numpy.bincount(indices, (replicaWeights * weights[numpy.newaxis, :]).ravel(), minlength=nReplicas * (self.nBins + 2)).reshape(nReplicas, self.nBins + 2)
+
+	def FindBin(self, value):
+		return int(self.getBins(numpy.array([value], dtype=numpy.float64))[0])
+
+	def Clone(self, name=None):
+		return Histogram(name or self.name, self.nBins, self.min, self.max, self.contents, self.sumw2, self.replicas)
+
+	def Add(self, other, factor=1.):
+		self.contents += factor * other.contents
+		self.sumw2 += factor**2 * other.sumw2
+		if self.replicas is not None and other.replicas is not None:
+			self.replicas += factor * other.replicas
+		else:
+			self.replicas = None
+
+	def Scale(self, factor):
+		self.contents *= factor
+		self.sumw2 *= factor**2
+		if self.replicas is not None:
+			self.replicas *= factor
+
+	def Rebin(self, ngroup, name=None):
+		# only for ngroup dividing the number of bins, the under- and overflow are kept
+		def rebin(array):
+			inner = array[..., 1:-1].reshape(array.shape[:-1] + (self.nBins / ngroup, ngroup)).sum(axis=-1)
+			return numpy.concatenate([array[..., :1], inner, array[..., -1:]], axis=-1)
+		replicas = None if self.replicas is None else rebin(self.replicas)
+		return Histogram(name or self.name, self.nBins / ngroup, self.min, self.max, rebin(self.contents), rebin(self.sumw2), replicas)
+
+	def Integral(self, first=None, last=None):
+		# without arguments the under- and overflow are not included (as in ROOT), without last up to the overflow
+		if first is None:
+			first, last = 1, self.nBins
+		elif last is None:
+			last = self.nBins + 1
+		first = max(first, 0)
+		last = min(last, self.nBins + 1)
+		if last < first:
+			return 0.
+		return float(self.contents[first:last+1].sum())
+
+	def integralAndError(self, first, last):
+		first = max(first, 0)
+		last = min(last, self.nBins + 1)
+		if last < first:
+			return 0., 0.
+		return float(self.contents[first:last+1].sum()), float(numpy.sqrt(self.sumw2[first:last+1].sum()))
+
+	def GetName(self):
+		return self.name
+
+	def SetName(self, name):
+		self.name = name
+
+	def GetNbinsX(self):
+		return self.nBins
+
+	def GetBinContent(self, ibin):
+		return float(self.contents[ibin])
+
+	def SetBinContent(self, ibin, value):
+		self.contents[ibin] = value
+
+	def GetBinError(self, ibin):
+		return float(numpy.sqrt(self.sumw2[ibin]))
+
+	def GetBinLowEdge(self, ibin):
+		return self.min + (ibin - 1) * (self.max - self.min) / self.nBins
+
+	def getArrays(self):
+		# contents and squared errors of all bins, including under- and overflow
+		return self.contents.copy(), self.sumw2.copy()
+
+	def toROOT(self):
+		hist = ROOT.TH1D(self.name, self.name, self.nBins, self.min, self.max)
+		hist.SetDirectory(0)
+		hist.Sumw2()
+		for ibin in xrange(self.nBins + 2):
+			hist.SetBinContent(ibin, self.contents[ibin])
+			hist.SetBinError(ibin, numpy.sqrt(self.sumw2[ibin]))
+		hist.SetEntries(self.contents.sum())
+		return hist
+
+def fromROOT(hist):
+	nBins = hist.GetNbinsX()
+	contents = [hist.GetBinContent(i) for i in xrange(nBins + 2)]
+	sumw2 = [hist.GetBinError(i)**2 for i in xrange(nBins + 2)]
+	axis = hist.GetXaxis()
+	return Histogram(hist.GetName(), nBins, axis.GetXmin(), axis.GetXmax(), contents, sumw2)
+
+def toROOT(obj):
+	# the ROOT object for the output and the plots, other objects are returned unchanged
+	if isinstance(obj, Histogram):
+		return obj.toROOT()
+	return obj
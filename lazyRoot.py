@@ -0,0 +1,42 @@
+import sys
+
+###############################
+# ROOT is imported when it is used for the first time: for reading the trees, the output file, RooStats and the plots
+# the cut scan, the ranking and the rating methods work on numpy arrays (see histogram.py) and do not need it
+
+class LazyModule(object):
+	def __init__(self, name):
+		self._name = name
+		self._module = None
+		self._callbacks = []
+
+	def __getattr__(self, name):
+		return getattr(self.load(), name)
+
+	def load(self):
+		if self._module is None:
+			self._module = __import__(self._name)
+			for callback in self._callbacks:
+				callback(self._module)
+			self._callbacks = []
+		return self._module
+
+	def isLoaded(self):
+		return self._module is not None
+
+	def whenLoaded(self, callback):
+		# callback(module) is called once the module is imported (immediately if it is already imported)
+		if self._module is not None or self._name in sys.modules:
+			callback(self.load())
+		else:
+			self._callbacks.append(callback)
+
+ROOT = LazyModule("ROOT")
+
+def batchMode(errorIgnoreLevel=None):
+	# the settings of the scripts, applied when ROOT is imported
+	def setup(module):
+		module.gROOT.SetBatch(True)
+		if errorIgnoreLevel is not None:
+			module.gROOT.ProcessLine("gErrorIgnoreLevel = %d;" % errorIgnoreLevel)
+	ROOT.whenLoaded(setup)
@@ -0,0 +1,125 @@
+import numpy
+
+###############################
+# vectorised special functions, all arguments can be numpy arrays (they are broadcast against each other)
+
+LANCZOS_G = 7
+LANCZOS_COEFFICIENTS = [
+	0.99999999999980993, 676.5203681218851, -1259.1392167224028,
+	771.32342877765313, -176.61502916214059, 12.507343278686905,
+	-0.13857109526572012, 9.9843695780195716e-6, 1.5056327351493116e-7,
+]
+
+def lgamma(x):
+	# log(Gamma(x)) for x > 0 (Lanczos approximation)
+	x = numpy.asarray(x, dtype=numpy.float64)
+	# reflection for small arguments: Gamma(x) Gamma(1-x) = pi / sin(pi x)
+	small = (x < 0.5)
+	z = numpy.where(small, 1. - x, x) - 1.
+
+	series = LANCZOS_COEFFICIENTS[0]
+	for i in xrange(1, len(LANCZOS_COEFFICIENTS)):
+		series = series + LANCZOS_COEFFICIENTS[i] / (z + i)
+	t = z + LANCZOS_G + 0.5
+	result = 0.5 * numpy.log(2. * numpy.pi) + (z + 0.5) * numpy.log(t) - t + numpy.log(series)
+
+	return numpy.where(small, numpy.log(numpy.pi / numpy.abs(numpy.sin(numpy.pi * x))) - result, result)
+
+###############################
+
+def _betaContinuedFraction(x, a, b, maxIterations=1000, epsilon=1e-15):
+	# continued fraction of the incomplete beta function (modified Lentz method)
+	tiny = 1e-300
+	qab = a + b
+	qap = a + 1.
+	qam = a - 1.
+
+	c = numpy.ones_like(x)
+	d = 1. - qab * x / qap
+	d = numpy.where(numpy.abs(d) < tiny, tiny, d)
+	d = 1. / d
+	h = d
+
+	for m in xrange(1, maxIterations + 1):
+		m2 = 2. * m
+
+		aa = m * (b - m) * x / ((qam + m2) * (a + m2))
+		d = 1. + aa * d
+		d = numpy.where(numpy.abs(d) < tiny, tiny, d)
+		c = 1. + aa / c
+		c = numpy.where(numpy.abs(c) < tiny, tiny, c)
+		d = 1. / d
+		h = h * d * c
+
+		aa = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+		d = 1. + aa * d
+		d = numpy.where(numpy.abs(d) < tiny, tiny, d)
+		c = 1. + aa / c
+		c = numpy.where(numpy.abs(c) < tiny, tiny, c)
+		d = 1. / d
+		delta = d * c
+		h = h * delta
+
+		if numpy.all(numpy.abs(delta - 1.) < epsilon):
+			break
+
+	return h
+
+def betaIncomplete(x, a, b):
+	# regularised incomplete beta function I_x(a, b), same as TMath::BetaIncomplete
+	x, a, b = numpy.broadcast_arrays(*[numpy.asarray(v, dtype=numpy.float64) for v in (x, a, b)])
+	inside = (x > 0.) & (x < 1.)
+	xs = numpy.where(inside, x, 0.5)
+
+	# the continued fraction converges fast for x < a / (a + b), otherwise the symmetry
+	# I_x(a, b) = 1 - I_(1-x)(b, a) is used (the same switch as in ROOT::Math::inc_beta)
+	swap = xs > a / (a + b)
+	xc = numpy.where(swap, 1. - xs, xs)
+	ac = numpy.where(swap, b, a)
+	bc = numpy.where(swap, a, b)
+
+	front = numpy.exp(lgamma(ac + bc) - lgamma(ac) - lgamma(bc) + ac * numpy.log(xc) + bc * numpy.log1p(-xc)) / ac
+	result = front * _betaContinuedFraction(xc, ac, bc)
+	result = numpy.where(swap, 1. - result, result)
+
+	result = numpy.where(x <= 0., 0., result)
+	return numpy.where(x >= 1., 1., result)
+
+###############################
+
+# rational approximations of the normal quantile (P. J. Acklam), relative error below 1.2e-9
+QUANTILE_A = [-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02, 1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00]
+QUANTILE_B = [-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02, 6.680131188771972e+01, -1.328068155288572e+01]
+QUANTILE_C = [-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00, -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00]
+QUANTILE_D = [7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00, 3.754408661907416e+00]
+QUANTILE_TAIL = 0.02425
+
+def _polynomial(coefficients, x):
+	result = numpy.zeros_like(x)
+	for coefficient in coefficients:
+		result = result * x + coefficient
+	return result
+
+def _quantileTail(p):
+	# quantile for p in the lower tail (p < QUANTILE_TAIL)
+	q = numpy.sqrt(-2. * numpy.log(p))
+	return _polynomial(QUANTILE_C, q) / (_polynomial(QUANTILE_D, q) * q + 1.)
+
+def normalQuantileC(p):
+	# z such that the upper tail of the standard normal distribution above z is p,
+	# same as ROOT::Math::normal_quantile_c(p, 1) and RooStats::PValueToSignificance
+	p = numpy.asarray(p, dtype=numpy.float64)
+	lower = p < QUANTILE_TAIL
+	upper = p > 1. - QUANTILE_TAIL
+
+	q = numpy.where(lower | upper, 0., p - 0.5)
+	r = q * q
+	central = -_polynomial(QUANTILE_A, r) * q / (_polynomial(QUANTILE_B, r) * r + 1.)
+
+	with numpy.errstate(divide="ignore", invalid="ignore"):
+		lowerTail = -_quantileTail(numpy.where(lower, p, QUANTILE_TAIL))
+		upperTail = _quantileTail(numpy.where(upper, 1. - p, QUANTILE_TAIL))
+
+	result = numpy.where(lower, lowerTail, numpy.where(upper, upperTail, central))
+	result = numpy.where(p <= 0., numpy.inf, result)
+	return numpy.where(p >= 1., -numpy.inf, result)
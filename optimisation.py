@@ -1,15 +1,22 @@
 #!/usr/bin/env python
 import sys
 import os
+import copy
+import numpy
 
-from ROOT import *
-import PlotStyle
 import utils
 from collections import namedtuple
 
 from ratingMethods import *
-from rankVariables import VariableRanker
+from rankVariables import VariableRanker, Rating
 from getOptimalCut import CutFinder
+from eventCache import EventCache
+from outputWriter import OutputWriter
+from plotting import PlotPool
+import cutEvolution
+import profiling
+import lazyRoot
+from lazyRoot import ROOT
 import configuration
 from tabulate import tabulate
 
@@ -18,7 +25,7 @@ from tabulate import tabulate
 
 def checkInputSettings(config):
 	# check whether the important inputs are set
-	if not config.signal:
+	if not (config.signal or config.signals):
 		print "ERROR: no signal tree is selected"
 		sys.exit(1)
 	if not config.backgrounds:
@@ -28,9 +35,22 @@ def checkInputSettings(config):
 		print "ERROR: no variables are defined which should be used for the optimisation"
 		sys.exit(1)
 
+def pruneChains(config):
+	# the chains only read the branches needed for the variables, weights and the preselection
+	expressions = list(config.Variables) + [config.event_weight, config.preselection]
+	samples = ([config.signal] if config.signal else []) + (config.signals or []) + config.backgrounds
+	for sample in samples:
+		utils.pruneBranches(sample.chain, expressions + [sample.weight], print_branches=True)
+
 ###############################
 CutInformation = namedtuple("CutInformation", "value lower_cut")
 
+# a partial cut sequence of the beam search
+# cuts: list of (var, lower_cut, cutValue) in the order they are applied
+# selection: the events of the event cache surviving these cuts
+# history: the ranked variables (without histograms) of each iteration before these cuts, for the iteration graphs
+BeamState = namedtuple("BeamState", "cuts cutList selection rating history")
+
 def addToCutList(cutList, bestVar, lower_cut, cutValue):
 	# test whether the cutDirection is the same
 	# change the cut value (if it is in the correct direction)
@@ -38,7 +58,11 @@ def addToCutList(cutList, bestVar, lower_cut, cutValue):
 		if cutList[bestVar].lower_cut != lower_cut:
 			print "ERROR: the direction of the cut is changed somewhere"
 			sys.exit(1)
-		if lower_cut and (cutList[bestVar].value < cutValue):
+		if lower_cut == utils.WINDOW:
+			# the events outside of the old window are already removed, so only the overlap of both windows is selected
+			oldLow, oldHigh = cutList[bestVar].value
+			cutList[bestVar] = CutInformation((max(oldLow, cutValue[0]), min(oldHigh, cutValue[1])), lower_cut)
+		elif lower_cut and (cutList[bestVar].value < cutValue):
 			print "ERROR: the new cut value is bigger than the old one (it should be smaller)"
 			sys.exit(1)
 		elif (not lower_cut) and (cutList[bestVar].value > cutValue):
@@ -52,30 +76,44 @@ def addToCutList(cutList, bestVar, lower_cut, cutValue):
 
 	return cutList
 
+def directionString(lower_cut):
+	if lower_cut == utils.WINDOW:
+		return "window"
+	return "<" if lower_cut else ">"
+
 ###############################
 
 def saveHistograms(rFile, varList, counter):
 	# creates a directory where the different distributions are stored
-	directory = rFile.mkdir("step_" + str(counter))
+	with profiling.timer("saveHistograms"):
+		directory = rFile.mkdir("step_" + str(counter))
 
-	for var in varList:
-		if var.sigHist:
-			directory.WriteTObject(var.sigHist, "sig_" + var.var)
-		if var.bkgHist:
-			directory.WriteTObject(var.bkgHist, "bkg_" + var.var)
+		for var in varList:
+			if var.sigHist:
+				directory.WriteTObject(var.sigHist, "sig_" + var.var)
+			if var.bkgHist:
+				directory.WriteTObject(var.bkgHist, "bkg_" + var.var)
+		rFile.Flush()
 
 ###############################
 
 def initGraphs(varList):
 	graphs = {}
 	for var in varList:
-		graphs[var] = TGraph()
-	graphs["rating"] = TGraph()
+		graphs[var] = ROOT.TGraph()
+		if varList[var].lower_cut == utils.WINDOW:
+			# the lower edge of a window is stored in the graph of the variable
+			graphs[var + "_high"] = ROOT.TGraph()
+	graphs["rating"] = ROOT.TGraph()
 	return graphs
 
 def fillGraphs(graphs, varList, counter):
 	for varItem in varList:
-		graphs[varItem.var].SetPoint(counter, counter, varItem.cut)
+		if varItem.lower_cut == utils.WINDOW and varItem.cut is not None:
+			graphs[varItem.var].SetPoint(counter, counter, varItem.cut[0])
+			graphs[varItem.var + "_high"].SetPoint(counter, counter, varItem.cut[1])
+		else:
+			graphs[varItem.var].SetPoint(counter, counter, varItem.cut)
 
 	graphs["rating"].SetPoint(counter, counter, varList[0].rating)
 
@@ -93,6 +131,14 @@ def initObject(target, source, useGetOptimalCut=None):
 			setattr(target, key, useGetOptimalCut)
 		elif (key == "finder"):
 			pass
+		elif (key == "cache"):
+			pass
+		elif (key == "lastCutVar"):
+			pass
+		elif (key == "appliedCuts"):
+			pass
+		elif (key == "baseHists"):
+			pass
 
 		# signal and background are stored as sample object for the optimisation
 		# but only as chain for the VariableRanker and CutFinder
@@ -113,7 +159,7 @@ def initObject(target, source, useGetOptimalCut=None):
 
 ###############################
 
-def optimiseCuts(config, rFile):
+def optimiseCuts(config, rFile, cache=None):
 	rankMeth_inMETHODS = False
 	for m in METHODS:
 		if config.rankingMethod == m.name:
@@ -126,128 +172,414 @@ def optimiseCuts(config, rFile):
 	prevRating = None
 	bestCut = None
 	bestRating = None
-	cutDirectionString = None
 	cutDirection = None
 	bestVar = None
 	cutList = {}
 	counter = 0
+	stability = [] # the applied cuts with their spread over the bootstrap replicas
 
 	ranker = VariableRanker()
 	initObject(ranker, config, rankMeth_inMETHODS)
 	finder = CutFinder()
 	initObject(finder, config)
+	finder.cache = cache
 	ranker.finder = finder
+	# the cut of a variable chosen by a ranking method is calculated with the optimisation method
+	cutMethod = config.method
+	if not rankMeth_inMETHODS:
+		finder.method = optMethod
+		cutMethod = optMethod
 
 	graphs = initGraphs(config.Variables)
 
 	while True:
+		profiling.setIteration(counter)
 		varList = ranker.rankVariables(config.Variables, counter)
 		saveHistograms(rFile, varList, counter)
 		fillGraphs(graphs, varList, counter)
 
+		if not rankMeth_inMETHODS and numpy.isnan(varList[0].rating):
+			# the separations are NaN for variables without signal or background events
+			print "no variable with signal and background events is left"
+			break
+
 		bestVar = varList[0].var 
 		
 		# when the ranking method is not defined in METHODS, the optimal cut need to be calculated separatly
 		if rankMeth_inMETHODS: 
 			bestCut = varList[0].cut 
 			bestRating = varList[0].rating
-			cutDirectionString = "<" if varList[0].lower_cut else ">"
 			cutDirection = varList[0].lower_cut
+			spread = (varList[0].cutSpread, varList[0].ratingSpread)
 		else:
 			rangeDef = config.Variables[bestVar]
 
 			result = finder.getOptimalCut(bestVar, rangeDef.nBins, rangeDef.min, rangeDef.max, rangeDef.lower_cut, counter)
 			bestCut = result.cutValue
 			bestRating = result.rating
-			cutDirectionString = "<" if rangeDef.lower_cut else ">"
 			cutDirection = rangeDef.lower_cut
+			spread = (result.cutSpread, result.ratingSpread)
 
 		if prevRating != None and terminateLoop(prevRating, bestRating):
 			break
 
-		# add the calculated cut to the preselection for the next iteration
-		cutString = " && (" + bestVar + cutDirectionString + str(bestCut) + ")"
+		# the cut string is only kept for the output, the next iterations
+		# only look at the events which survived the calculated cut
+		cutString = " && " + utils.cutExpression(bestVar, cutDirection, bestCut)
 		config.preselection += cutString
-		ranker.preselection = config.preselection
-		finder.preselection = config.preselection
+		finder.addCut(bestVar, cutDirection, bestCut, counter)
+		ranker.lastCutVar = bestVar
 
 		# prepare a list which is used as final result
 		cutList = addToCutList(cutList, bestVar, cutDirection, bestCut)
+		stability.append([counter, bestVar, directionString(cutDirection), bestCut, spread[0], bestRating, spread[1]])
 		
 		prevRating = bestRating
 		counter += 1
 
 	saveGraphs(graphs, rFile)
 
+	if config.bootstrapReplicas > 0:
+		print "\n\nSTABILITY OF THE CUTS,", config.bootstrapReplicas, "BOOTSTRAP REPLICAS\n"
+		print tabulate(stability, headers=["iteration", "variable name", "cut direction", "cut value", "cut spread", cutMethod.title, cutMethod.title + " spread"], tablefmt="simple")
+
 	return cutList
 
-def printExpectedEvents(config, title):
-	print "Expected events", title
+def optimiseBeam(config, rFile, cache):
+	# instead of only the best cut, the config.beamWidth best cut sequences are kept after each iteration
+	# the histograms of a sequence are filled once for all its continuations and the selection
+	# of a continuation is derived from the one of the sequence
+	if config.rankingMethod not in [m.name for m in METHODS]:
+		print "ERROR: the beam search needs a ranking method which calculates the optimal cut"
+		sys.exit(1)
+	method = getMethod(config.rankingMethod, METHODS)
+	config.method = method
 
-	expectedEvents = []
-	MCEvents = []
-	totalBackground = 0
-	totalMCBkg = 0
+	ranker = VariableRanker()
+	initObject(ranker, config, True)
+	finder = CutFinder()
+	initObject(finder, config)
+	finder.cache = cache
+	ranker.finder = finder
 
-	for bkg in config.backgrounds:
-		evt = utils.getHistogram("1.0", 1, 0, 2, bkg.chain, config.event_weight, bkg.weight, bkg.name + "_expEvt", config.preselection, config.lumi).Integral()
-		# MC events
-		mcevt = utils.getHistogram("1.0", 1, 0, 2, bkg.chain, config.event_weight, bkg.weight, bkg.name + "_expEvt", config.preselection, config.lumi, nMCEvents=True).Integral()
+	beams = [BeamState([], {}, cache.selection, None, [])]
+	best = beams[0]
+	bestHistory = None # the history of the best sequence including its own ranking
+	counter = 0
 
-		expectedEvents.append((bkg.name, evt, mcevt))
+	while beams:
+		profiling.setIteration(counter)
+		continuations = {}
+		for i, state in enumerate(beams):
+			cache.selection = state.selection
+			varList = ranker.rankVariables(config.Variables, counter)
+			saveHistograms(rFile, varList, str(counter) + "_beam_" + str(i))
+			history = state.history + [[rating._replace(sigHist=None, bkgHist=None) for rating in varList]]
+			if state is best:
+				bestHistory = history
+
+			for candidate in varList[:config.beamWidth]:
+				if candidate.rating is None:
+					continue
+				if state.rating != None and terminateLoop(state.rating, candidate.rating):
+					continue
+
+				selection = cache.applyCut(state.selection, candidate.var, candidate.lower_cut, candidate.cut)
+				if sameSelection(selection, state.selection):
+					# the cut does not remove any event
+					continue
+
+				cutList = addToCutList(dict(state.cutList), candidate.var, candidate.lower_cut, candidate.cut)
+				# sequences with the same cuts in a different order are only continued once
+				key = frozenset(cutList.iteritems())
+				if key not in continuations:
+					continuations[key] = BeamState(state.cuts + [(candidate.var, candidate.lower_cut, candidate.cut)], cutList, selection, candidate.rating, history)
+
+		continuations = continuations.values()
+		order = method.rank([state.rating for state in continuations])
+		beams = [continuations[i] for i in order[:config.beamWidth]]
+
+		if beams and (best.rating == None or method.compare(beams[0].rating, best.rating)):
+			best = beams[0]
+		counter += 1
 
-		totalBackground += evt
-		totalMCBkg += mcevt
+	print "\n\nBEST CUT SEQUENCE,", method.title, best.rating
+	print tabulate([[var, directionString(lower_cut), cutValue] for var, lower_cut, cutValue in best.cuts], headers=["variable name", "cut direction", "cut value"], tablefmt="simple")
 
-	expectedEvents.append(("Total SM", totalBackground, totalMCBkg))
+	# the iteration graphs show the rankings along the best sequence, as for the greedy optimisation
+	graphs = initGraphs(config.Variables)
+	for step, varList in enumerate(bestHistory):
+		fillGraphs(graphs, varList, step)
+	saveGraphs(graphs, rFile)
 
-	sig = utils.getHistogram("1.0", 1, 0, 2, config.signal.chain, config.event_weight, config.signal.weight, config.signal.name + "_expEvt", config.preselection, config.lumi).Integral()
-	sigMC = utils.getHistogram("1.0", 1, 0, 2, config.signal.chain, config.event_weight, config.signal.weight, config.signal.name + "_expEvt", config.preselection, config.lumi, nMCEvents=True).Integral()
-	expectedEvents.append((config.signal.name, sig, sigMC))
+	# the final yields are calculated for the best sequence
+	cache.selection = best.selection
+	for var, lower_cut, cutValue in best.cuts:
+		config.preselection += " && " + utils.cutExpression(var, lower_cut, cutValue)
 
-	print tabulate(expectedEvents, headers=["Sample", "expected events", "MC events"], tablefmt="simple")
+	return best.cutList
 
+def optimiseEvolution(config, rFile, cache):
+	# all cuts are searched at once on the events in memory: each generation is a population of
+	# cut vectors which is rated as a whole, the best ones are kept and varied for the next generation
+	method = getMethod(config.optimisationMethod, METHODS)
+	finder = CutFinder()
+	initObject(finder, config)
+	finder.method = method
+	finder.damp_func = None # the damping only makes sense when one cut is added after the other
+
+	variables = list(config.Variables)
+	ranges = [config.Variables[var] for var in variables]
+
+	# values and (expected, squared expected and MC) weights of the signal and each background
+	events = []
+	for sample, indices in [(cache.signal, cache.selection.signal)] + zip(cache.backgrounds, cache.selection.backgrounds):
+		weights = sample.weights[indices]
+		eventWeights = sample.eventWeights[indices] * weights * config.lumi
+		events.append(([sample.columns[var][indices] for var in variables], [eventWeights, eventWeights**2, weights]))
+
+	population = config.evolutionPopulation
+	nElite = max(1, population / 5)
+	nRandom = population / 10
+	rng = numpy.random.RandomState(config.evolutionSeed)
+	cuts = cutEvolution.randomCuts(rng, population, ranges, 0.5)
+
+	best = None
+	graph = ROOT.TGraph()
+	for generation in xrange(config.evolutionGenerations):
+		profiling.setIteration(generation)
+		ratings, valid, sig_nEvents, bkg_nEvents = rateCutVectors(finder, events, cuts, ranges)
+
+		bestIndex = method.best(ratings, valid)
+		if bestIndex is not None and (best is None or method.compare(ratings[bestIndex], best[1])):
+			best = (cuts[bestIndex].copy(), float(ratings[bestIndex]), sig_nEvents[bestIndex], bkg_nEvents[bestIndex])
+		if best:
+			graph.SetPoint(graph.GetN(), generation, best[1])
+			print "generation", generation, method.title, best[1], "signal", best[2], "background", best[3]
+
+		# the next generation: the best candidates, variations of them (with a decreasing step size) and new random candidates
+		elite = cuts[method.rank(numpy.where(valid, ratings, numpy.nan))[:nElite]]
+		width = 0.1 * (1. - float(generation) / config.evolutionGenerations)
+		parents = elite[rng.randint(len(elite), size=population - len(elite) - nRandom)]
+		cuts = numpy.vstack([elite, cutEvolution.mutateCuts(rng, parents, ranges, width, 0.05), cutEvolution.randomCuts(rng, nRandom, ranges, 0.5)])
 
-###############################
+	directory = rFile.mkdir("iterationPlots")
+	directory.WriteTObject(graph, "rating")
 
-def terminateLoop(prev, cur):
-	return abs(prev - cur) / abs(prev) < 0.01
+	cutList = {}
+	if not best:
+		print "ERROR: no cuts fulfill the requirements on the MC statistics"
+		return cutList
 
-###############################
+	for i, lower_cut, cutValue in cutEvolution.activeCuts(best[0], ranges):
+		config.preselection += " && " + utils.cutExpression(variables[i], lower_cut, cutValue)
+		cache.addCut(variables[i], lower_cut, cutValue)
+		cutList = addToCutList(cutList, variables[i], lower_cut, cutValue)
 
-def parse_options():
-		import argparse
+	return cutList
 
-		parser = argparse.ArgumentParser()
-		parser.add_argument("configFile", help="the configuration stored in a python file")
+def rateCutVectors(finder, events, cuts, ranges):
+	sums = [cutEvolution.passingSums(values, weightsList, cuts, ranges) for values, weightsList in events]
+	sig_nEvents, sig_error2, sig_nMCEvents = sums[0]
+	bkg_nEventsList = numpy.array([bkgSums[0] for bkgSums in sums[1:]])
+	bkg_error2 = numpy.array([bkgSums[1] for bkgSums in sums[1:]]).sum(axis=0)
+	bkg_nMCEventsList = numpy.array([bkgSums[2] for bkgSums in sums[1:]])
+	totalBkgEventsList = numpy.array([weightsList[0].sum() for values, weightsList in events[1:]])
+
+	ratings, valid = finder.rateCuts(sig_nEvents, sig_error2, bkg_nEventsList, bkg_error2, sig_nMCEvents, bkg_nMCEventsList, totalBkgEventsList, 0)
+	return ratings, valid, sig_nEvents, bkg_nEventsList.sum(axis=0)
+
+def sameSelection(selectionA, selectionB):
+	# cuts only remove events, so the selections are the same if they contain the same number of events
+	if len(selectionA.signal) != len(selectionB.signal):
+		return False
+	for indicesA, indicesB in zip(selectionA.backgrounds, selectionB.backgrounds):
+		if len(indicesA) != len(indicesB):
+			return False
+	return True
+
+def runOptimisation(config, rFile, cache=None):
+	if config.evolutionPopulation > 0:
+		return optimiseEvolution(config, rFile, cache)
+	if config.beamWidth > 1:
+		return optimiseBeam(config, rFile, cache)
+	return optimiseCuts(config, rFile, cache)
+
+def optimiseCompromise(config, rFile, caches):
+	# one cut list for several signal points, the caches contain the same backgrounds
+	# each cut is chosen by the average rating of all signal points
+	for var, rangeDef in config.Variables.iteritems():
+		if rangeDef.lower_cut == utils.WINDOW:
+			print "ERROR: window cuts are not supported for the compromise of several signal points"
+			sys.exit(1)
 
-		opts = parser.parse_args()
-		return opts
+	# the variables are rated by the averaged cumulative ratings on the bin edges
+	if config.rankingMethod != config.optimisationMethod:
+		print "WARNING: the compromise of several signal points ranks the variables with the optimisation method", config.optimisationMethod + ", the ranking method", config.rankingMethod, "is not used"
+	if config.scanMode == "unbinned":
+		print "WARNING: the compromise of several signal points only scans the bin edges, the unbinned scan is not used"
+	if config.bootstrapReplicas > 0:
+		print "WARNING: the compromise of several signal points does not calculate the bootstrap spread, the replicas are not filled"
 
-###############################
+	method = getMethod(config.optimisationMethod, METHODS)
+	prevRating = None
+	cutList = {}
+	counter = 0
 
-def main():
-	gROOT.SetBatch(True)
-	gROOT.ProcessLine("gErrorIgnoreLevel = 1001;") # ignore INFO and below
+	finder = CutFinder()
+	initObject(finder, config)
+	finder.method = method
+	finder.cache = caches[0]
+	finder.bootstrapReplicas = 0
 
-	opts = parse_options()
-	config = configuration.load_config(opts.configFile)
-	cutPreselection = config.preselection # save the preselection for further usage
+	binnings = utils.getBinnings(config.Variables)
+	graphs = initGraphs(config.Variables)
+
+	while True:
+		profiling.setIteration(counter)
+		# the backgrounds are only filled for the first signal point
+		hists = finder.fillHistograms(binnings)
+		sigHists = [dict((var, (varHists.sigHist, varHists.sigHistMC)) for var, varHists in hists.iteritems())]
+		for i, cache in enumerate(caches[1:]):
+			sigHists.append(cache.fillHistograms(binnings, cache.signal, cache.selection.signal, "sig_" + str(i+1), config.lumi))
+
+		varList = []
+		for var, rangeDef in config.Variables.iteritems():
+			bkgHistList = hists[var].bkgHistList
+			ratings = []
+			valid = True
+			sig_nEvents = []
+			for pointHists in sigHists:
+				sigHist, sigHistMC = pointHists[var]
+				pointRatings, pointValid, pointSig_nEvents, bkg_nEvents = finder.rateCumulative(sigHist, sigHistMC, bkgHistList, hists[var].bkgHistMCList, rangeDef.lower_cut, counter)
+				ratings.append(pointRatings)
+				valid &= pointValid
+				sig_nEvents.append(pointSig_nEvents)
+			ratings = numpy.mean(ratings, axis=0)
+
+			rating = None
+			nEvents_sig = -1
+			nEvents_bkg = -1
+			bestBin = method.best(ratings, valid)
+			if bestBin is None:
+				bestBin = 0
+			else:
+				rating = float(ratings[bestBin])
+				nEvents_sig = numpy.mean(sig_nEvents, axis=0)[bestBin]
+				nEvents_bkg = bkg_nEvents[bestBin]
+			cut = finder.getBinCutValue(hists[var].sigHist, bestBin, rangeDef.lower_cut)
+			cut = finder.checkCutValue(cut, bestBin, rangeDef.nBins, rangeDef.min, rangeDef.max, rangeDef.lower_cut)
+
+			bkgHist = bkgHistList[0].Clone()
+			for hist in bkgHistList[1:]:
+				bkgHist.Add(hist)
+			varList.append(Rating(var, cut, rating, rangeDef.lower_cut, None, bkgHist, nEvents_sig, nEvents_bkg))
+
+		order = method.rank([rating.rating for rating in varList])
+		varList = [varList[i] for i in order]
+		table = [[rating.var, rating.cut, rating.rating, rating.nEvents_sig, rating.nEvents_bkg] for rating in varList]
+		print tabulate(table, headers=["variable name", "cut value", "average " + method.title, "average signal", "background"], tablefmt="simple")
+
+		saveHistograms(rFile, varList, counter)
+		fillGraphs(graphs, varList, counter)
+
+		best = varList[0]
+		if prevRating != None and terminateLoop(prevRating, best.rating):
+			break
+
+		config.preselection += " && " + utils.cutExpression(best.var, best.lower_cut, best.cut)
+		finder.addCut(best.var, best.lower_cut, best.cut, counter)
+		for cache in caches[1:]:
+			cache.addSignalCut(best.var, best.lower_cut, best.cut, caches[0].selection.backgrounds)
+
+		cutList = addToCutList(cutList, best.var, best.lower_cut, best.cut)
+
+		prevRating = best.rating
+		counter += 1
+
+	saveGraphs(graphs, rFile)
+
+	return cutList
+
+def optimiseSignalGrid(config, rFile):
+	# all signal points are optimised against the same backgrounds, which are read only once
+	cutPreselection = config.preselection
+	cache = EventCache(config.Variables, config.event_weight, config.preselection, config.maxMemory)
+	cache.load(config.signals[0], config.backgrounds)
+	caches = [cache] + [cache.withSignal(signal) for signal in config.signals[1:]]
+
+	if config.signalGridMode == "compromise":
+		# the first signal point is filled by the CutFinder together with the backgrounds
+		config.signal = config.signals[0]
+		cutList = optimiseCompromise(config, rFile, caches)
+		printResults(config, cutList, cutPreselection, zip(config.signals, caches))
+		return
+
+	for signal, cache in zip(config.signals, caches):
+		print "\n\nSIGNAL POINT", signal.name
+		pointConfig = copy.copy(config)
+		pointConfig.signal = signal
+		pointConfig.preselection = cutPreselection
+		cutList = runOptimisation(pointConfig, rFile.mkdir(signal.name), cache)
+		printResults(pointConfig, cutList, cutPreselection, [(signal, cache)])
+
+def getExpectedEvents(config, sample):
+	evt = utils.getHistogram("1.0", 1, 0, 2, sample.chain, config.event_weight, sample.weight, sample.name + "_expEvt", config.preselection, config.lumi, maxMemory=config.maxMemory).Integral()
+	# MC events
+	mcevt = utils.getHistogram("1.0", 1, 0, 2, sample.chain, config.event_weight, sample.weight, sample.name + "_expEvt", config.preselection, config.lumi, nMCEvents=True, maxMemory=config.maxMemory).Integral()
+	return evt, mcevt
+
+def getYieldTable(config, cache=None, signal=None):
+	# rows (sample, expected events, MC events) for the backgrounds, their sum and the signal
+	if not signal:
+		signal = config.signal
+
+	expectedEvents = []
+	totalBackground = 0
+	totalMCBkg = 0
+
+	for i, bkg in enumerate(config.backgrounds):
+		if cache:
+			evt, mcevt = cache.getYields(cache.backgrounds[i], cache.selection.backgrounds[i], config.lumi)
+		else:
+			evt, mcevt = getExpectedEvents(config, bkg)
+
+		expectedEvents.append((bkg.name, evt, mcevt))
+
+		totalBackground += evt
+		totalMCBkg += mcevt
+
+	expectedEvents.append(("Total SM", totalBackground, totalMCBkg))
+
+	if cache:
+		sig, sigMC = cache.getYields(cache.signal, cache.selection.signal, config.lumi)
+	else:
+		sig, sigMC = getExpectedEvents(config, signal)
+	expectedEvents.append((signal.name, sig, sigMC))
+
+	return expectedEvents
+
+def printExpectedEvents(config, title, cache=None, signal=None):
+	print "Expected events", title
+	print tabulate(getYieldTable(config, cache, signal), headers=["Sample", "expected events", "MC events"], tablefmt="simple")
 
-	rFile = TFile(opts.configFile.replace(".py", ".root"), "RECREATE")
 
-	checkInputSettings(config)
-	cutList = optimiseCuts(config, rFile)
+###############################
 
+def printResults(config, cutList, cutPreselection, signals):
+	# signals: list of (signal sample, event cache or None) for which the expected events are printed
 	table = []
 	print "\n\nFINAL RESULTS\n"
 	header = ["variable name", "cut direction", "cut value"]
 	for cut, cutInfo in cutList.iteritems():
-		cutDirectionString = "<" if cutInfo.lower_cut else ">"
-		table.append([cut, cutDirectionString, cutInfo.value])
+		table.append([cut, directionString(cutInfo.lower_cut), cutInfo.value])
 	print tabulate(table, headers=header, tablefmt="simple")
 
-	printExpectedEvents(config, "after final selection")
+	for signal, cache in signals:
+		title = "after final selection"
+		if config.signals:
+			title = "for " + signal.name + " " + title
+		printExpectedEvents(config, title, cache, signal)
 
 	print "\n\nCut string which can directly used for other plotting code"
 	print config.preselection
@@ -264,8 +596,7 @@ def main():
 		for cut, cutInfo in cutList.iteritems():
 			if cut == var:
 				continue
-			cutDirectionString = "<" if cutInfo.lower_cut else ">"
-			cuts.append(cut + cutDirectionString + str(cutInfo.value))
+			cuts.append(utils.cutExpression(cut, cutInfo.lower_cut, cutInfo.value))
 
 		cutArray.append(" && ".join(cuts))
 
@@ -279,10 +610,72 @@ def main():
 	print ")"
 
 	print "CUTVALUES=("
-	print "\t" + "\n\t".join(map(lambda s: '"%s"' % s, cvlArray))
+	print "\t" + "\n\t".join(map(lambda s: '"%s"' % (s,), cvlArray))
 	print ")"
 
-	rFile.Close()
+
+###############################
+
+def terminateLoop(prev, cur):
+	return abs(prev - cur) / abs(prev) < 0.01
+
+###############################
+
+def parse_options():
+		import argparse
+
+		parser = argparse.ArgumentParser()
+		parser.add_argument("configFile", help="the configuration stored in a python file")
+
+		opts = parser.parse_args()
+		return opts
+
+###############################
+
+def main():
+	lazyRoot.batchMode(1001) # ignore INFO and below
+
+	opts = parse_options()
+	config = configuration.load_config(opts.configFile)
+	cutPreselection = config.preselection # save the preselection for further usage
+
+	outputName = opts.configFile.replace(".py", ".root")
+	if config.enable_plots:
+		# the plotting processes are started first, they do not need a copy of the events read later
+		config.plotter = PlotPool(config.plotProcesses, "plots", config.plotsPerIteration)
+	rFile = None
+
+	try:
+		rFile = OutputWriter(outputName, config.writeInBackground)
+		checkInputSettings(config)
+		if config.pruneBranches:
+			pruneChains(config)
+
+		if config.signals:
+			optimiseSignalGrid(config, rFile)
+		else:
+			cache = None
+			if config.use_cache or config.beamWidth > 1 or config.evolutionPopulation > 0:
+				# read the chains only once, all following steps are done in memory
+				cache = EventCache(config.Variables, config.event_weight, config.preselection, config.maxMemory)
+				cache.load(config.signal, config.backgrounds)
+
+			cutList = runOptimisation(config, rFile, cache)
+			printResults(config, cutList, cutPreselection, [(config.signal, cache)])
+	finally:
+		# the remaining histograms and graphs are written before the file is closed,
+		# the plots are finished also if writing the file failed
+		try:
+			if rFile:
+				with profiling.timer("writing output"):
+					rFile.Close()
+		finally:
+			if config.plotter:
+				config.plotter.close()
+
+	if config.profile:
+		profiling.printSummary()
+		profiling.writeReport(outputName.replace(".root", "_profile.json"))
 
 ###############################
 
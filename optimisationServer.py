@@ -0,0 +1,399 @@
+#!/usr/bin/env python
+import os
+import sys
+import copy
+import json
+import stat
+import errno
+import socket
+import getpass
+import tempfile
+import traceback
+import StringIO
+import httplib
+import BaseHTTPServer
+from collections import namedtuple, OrderedDict
+import numpy
+
+import utils
+import lazyRoot
+import configuration
+import optimisation
+import profiling
+from eventCache import EventCache
+from outputWriter import OutputWriter, NullOutput
+
+###############################
+# resident optimisation: the samples of a config are read once into memory (as for "Config.use_cache") and kept,
+# optimisation jobs with other variables, methods, luminosity or preselection are then sent to a local http endpoint
+# the jobs are done one after the other, each one starts from the events passing its preselection
+# the endpoint is a unix socket which only the user running the server can open (no tcp port),
+# the output files of the jobs are restricted to a directory chosen when starting the server
+
+Range = namedtuple("Range", "min max nBins lower_cut")
+
+# settings of the configuration which can be changed by a job
+JOB_OPTIONS = ["rankingMethod", "optimisationMethod", "lumi", "flatBkgUncertainty", "includeMCstat", "scanMode", "unbinnedPoints",
+	"beamWidth", "evolutionPopulation", "evolutionGenerations", "evolutionSeed", "bootstrapReplicas", "bootstrapSeed", "fineBins", "nProcesses", "profile"]
+# the other keys of a job:
+# variables: list of names of Config.Variables, or dict var -> [min, max, nBins, direction] (direction: true, false or "window")
+# preselection: replaces Config.preselection, the chains are read again for a new preselection
+# cuts: list of [var, direction, value] applied to the events in memory before the optimisation
+# damp: name of a damping function of configuration.py (or null)
+# signal: name of the signal sample of Config.signals (by default the first one)
+# outputFile: the histograms and graphs are written to this ROOT file (relative to the output directory of the server), by default they are not stored
+JOB_KEYS = ["variables", "preselection", "cuts", "damp", "signal", "outputFile"]
+
+# the socket is not put into the working directory, AFS and EOS do not support unix sockets
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), "optimisationServer-%s.sock" % getpass.getuser())
+
+###############################
+
+def parseDirection(direction):
+	if direction in [True, False, utils.WINDOW]:
+		return direction
+	raise ValueError("unknown cut direction %r (true, false or \"%s\")" % (direction, utils.WINDOW))
+
+def jsonValue(obj):
+	# numpy numbers and arrays in the results
+	if isinstance(obj, numpy.generic):
+		return obj.item()
+	if isinstance(obj, numpy.ndarray):
+		return obj.tolist()
+	raise TypeError(repr(obj) + " is not JSON serializable")
+
+class JobError(Exception):
+	# the job is not valid, it is not started
+	pass
+
+###############################
+
+class OptimisationServer(object):
+	def __init__(self, config, maxCaches=4, outputDir="."):
+		self.config = config
+		self.maxCaches = maxCaches # number of preselections whose events are kept in memory
+		self.outputDir = os.path.realpath(outputDir) # the output files of the jobs are only written below this directory
+		self.caches = OrderedDict() # preselection -> {signal name: EventCache}, the least recently used first
+		self.signals = config.signals or [config.signal]
+
+	def getCache(self, preselection, variables, signal):
+		caches = self.caches.pop(preselection, None)
+		if caches is not None:
+			cache = caches.values()[0]
+			if not set(variables) <= set(cache.variables):
+				# the chains are read again with the new and the old variables
+				variables = cache.variables + [var for var in variables if var not in cache.variables]
+				caches = None
+
+		if caches is None:
+			while len(self.caches) >= self.maxCaches:
+				self.caches.popitem(last=False)
+			caches = {signal.name: self.loadCache(preselection, variables, signal)}
+		elif signal.name not in caches:
+			# the backgrounds are shared with the other signal samples
+			caches[signal.name] = caches.values()[0].withSignal(signal)
+
+		self.caches[preselection] = caches
+		return caches[signal.name]
+
+	def loadCache(self, preselection, variables, signal):
+		print "reading the events for", preselection
+		if self.config.pruneBranches:
+			loadConfig = copy.copy(self.config)
+			loadConfig.Variables = variables
+			loadConfig.preselection = preselection
+			optimisation.pruneChains(loadConfig)
+		cache = EventCache(variables, self.config.event_weight, preselection, self.config.maxMemory)
+		cache.load(signal, self.config.backgrounds)
+		return cache
+
+	def getSignal(self, name):
+		if name is None:
+			return self.signals[0]
+		for signal in self.signals:
+			if signal.name == name:
+				return signal
+		raise JobError("unknown signal sample " + name)
+
+	def getOutputPath(self, name):
+		# only relative paths below the output directory, also symbolic links must not lead out of it
+		if not isinstance(name, basestring) or not name or os.path.isabs(name) or ".." in name.replace("\\", "/").split("/"):
+			raise JobError("the output file must be a relative path without \"..\": %r" % (name,))
+		path = os.path.realpath(os.path.join(self.outputDir, name))
+		if not path.startswith(self.outputDir + os.sep):
+			raise JobError("the output file %r is not inside the output directory %s" % (name, self.outputDir))
+		return path
+
+	def jobConfig(self, job):
+		unknown = [key for key in job if key not in JOB_OPTIONS + JOB_KEYS]
+		if unknown:
+			raise JobError("unknown settings: " + ", ".join(unknown))
+
+		config = copy.copy(self.config)
+		for key in JOB_OPTIONS:
+			if key in job:
+				setattr(config, key, job[key])
+
+		if "damp" in job:
+			if job["damp"] is not None and job["damp"] not in configuration.damping_funcs:
+				raise JobError("unknown damping function " + job["damp"])
+			config.damp_func = configuration.damping_funcs.get(job["damp"])
+
+		variables = job.get("variables", self.config.Variables)
+		if isinstance(variables, dict):
+			try:
+				config.Variables = dict((var, Range(float(minV), float(maxV), int(nBins), parseDirection(direction))) for var, (minV, maxV, nBins, direction) in variables.iteritems())
+			except (ValueError, TypeError), e:
+				raise JobError("invalid variables: " + str(e))
+		else:
+			missing = [var for var in variables if var not in self.config.Variables]
+			if missing:
+				raise JobError("variables without range: " + ", ".join(missing))
+			config.Variables = dict((var, self.config.Variables[var]) for var in variables)
+
+		config.preselection = job.get("preselection", self.config.preselection)
+		config.signal = self.getSignal(job.get("signal"))
+		config.signals = None
+		# the plots are not made by the server
+		config.enable_plots = False
+		config.plotter = None
+		return config
+
+	def run(self, job):
+		# returns the cut list, the cut string and the expected events after all cuts
+		config = self.jobConfig(job)
+		outputPath = self.getOutputPath(job["outputFile"]) if "outputFile" in job else None
+		cuts = job.get("cuts", [])
+		cache = self.getCache(config.preselection, list(config.Variables) + [cut[0] for cut in cuts], config.signal)
+
+		baseSelection = cache.selection
+		rFile = OutputWriter(outputPath, config.writeInBackground) if outputPath else NullOutput()
+		profiling.reset()
+		try:
+			for var, direction, value in cuts:
+				direction = parseDirection(direction)
+				config.preselection += " && " + utils.cutExpression(var, direction, value)
+				cache.addCut(var, direction, value)
+			cutPreselection = config.preselection
+
+			cutList = optimisation.runOptimisation(config, rFile, cache)
+			optimisation.printResults(config, cutList, cutPreselection, [(config.signal, cache)])
+
+			result = {
+				"cuts": [[var, optimisation.directionString(info.lower_cut), info.value] for var, info in cutList.iteritems()],
+				"preselection": config.preselection,
+				"yields": optimisation.getYieldTable(config, cache),
+			}
+			if config.profile:
+				profiling.printSummary()
+				result["profile"] = profiling.getReport()
+			return result
+		finally:
+			# the next job starts again from the events passing the preselection
+			cache.selection = baseSelection
+			rFile.Close()
+
+	def submit(self, job):
+		# returns (http status, response), the output of the optimisation is returned as "log"
+		log = StringIO.StringIO()
+		stdout = sys.stdout
+		sys.stdout = log
+		try:
+			response = self.run(job)
+			status = 200
+		except JobError, e:
+			response = {"error": str(e)}
+			status = 400
+		except (Exception, SystemExit):
+			# the optimisation stops with sys.exit for invalid settings, the server continues
+			response = {"error": traceback.format_exc()}
+			status = 500
+		finally:
+			sys.stdout = stdout
+		response["log"] = log.getvalue()
+		return status, response
+
+	def status(self):
+		loaded = []
+		for preselection, caches in self.caches.iteritems():
+			for name, cache in caches.iteritems():
+				loaded.append({
+					"preselection": preselection,
+					"signal": name,
+					"variables": cache.variables,
+					"events": [len(sample.weights) for sample in [cache.signal] + cache.backgrounds],
+				})
+		return {"caches": loaded, "maxCaches": self.maxCaches}
+
+###############################
+
+class RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	# POST /optimise: a job as json, GET /status: the events in memory, POST /shutdown: stops the server
+	def do_GET(self):
+		if self.path == "/status":
+			self.reply(200, self.server.optimiser.status())
+		else:
+			self.reply(404, {"error": "unknown path " + self.path})
+
+	def do_POST(self):
+		if self.path == "/shutdown":
+			self.server.running = False
+			self.reply(200, {})
+			return
+		if self.path != "/optimise":
+			self.reply(404, {"error": "unknown path " + self.path})
+			return
+
+		try:
+			job = json.loads(self.rfile.read(int(self.headers.getheader("Content-Length", 0))))
+			if not isinstance(job, dict):
+				raise ValueError("the job must be a json object")
+		except ValueError, e:
+			self.reply(400, {"error": "invalid job: " + str(e)})
+			return
+
+		status, response = self.server.optimiser.submit(job)
+		print "job", json.dumps(job), "->", status
+		self.reply(status, response)
+
+	def reply(self, status, response):
+		body = json.dumps(response, default=jsonValue)
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		# the clients of a unix socket have no address
+		sys.stderr.write("%s - - [%s] %s\n" % (self.server.server_address, self.log_date_time_string(), format % args))
+
+class UnixHTTPServer(BaseHTTPServer.HTTPServer):
+	# http on a unix socket, only the owner can connect (mode 0600)
+	address_family = socket.AF_UNIX
+
+	def server_bind(self):
+		removeStaleSocket(self.server_address)
+		umask = os.umask(0o177) # no other user can connect in between bind and chmod
+		try:
+			self.socket.bind(self.server_address)
+		finally:
+			os.umask(umask)
+		os.chmod(self.server_address, 0o600)
+		self.server_name = "localhost"
+		self.server_port = 0
+
+	def server_close(self):
+		BaseHTTPServer.HTTPServer.server_close(self)
+		os.remove(self.server_address)
+
+class UnixHTTPConnection(httplib.HTTPConnection):
+	def __init__(self, socketPath):
+		httplib.HTTPConnection.__init__(self, "localhost")
+		self.socketPath = socketPath
+
+	def connect(self):
+		# the jobs (and their results) are not sent to a socket of another user
+		checkSocket(self.socketPath)
+		self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self.sock.connect(self.socketPath)
+
+def checkSocket(socketPath):
+	info = os.lstat(socketPath)
+	if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+		raise IOError("%s is not a socket of user %s" % (socketPath, getpass.getuser()))
+
+def removeStaleSocket(socketPath):
+	# the socket of a server which was killed is removed, a running server or a file of another user is kept
+	if not os.path.lexists(socketPath):
+		return
+	checkSocket(socketPath)
+	probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		probe.connect(socketPath)
+	except socket.error, e:
+		if e.errno != errno.ECONNREFUSED:
+			raise
+		os.remove(socketPath)
+		return
+	finally:
+		probe.close()
+	raise IOError("a server is already running on " + socketPath)
+
+def serve(optimiser, socketPath):
+	# one request after the other, the jobs change the selection of the event caches
+	server = UnixHTTPServer(socketPath, RequestHandler)
+	server.optimiser = optimiser
+	server.running = True
+	print "optimisation server listening on", socketPath
+	print "output files are written to", optimiser.outputDir
+	try:
+		while server.running:
+			server.handle_request()
+	finally:
+		server.server_close()
+
+def submit(job, socketPath, path="/optimise"):
+	# sends a job to a running server, returns (http status, response)
+	connection = UnixHTTPConnection(socketPath)
+	try:
+		connection.request("POST", path, json.dumps(job), {"Content-Type": "application/json"})
+		response = connection.getresponse()
+		return response.status, json.loads(response.read())
+	finally:
+		connection.close()
+
+###############################
+
+def parse_options():
+	import argparse
+
+	parser = argparse.ArgumentParser()
+	parser.add_argument("configFile", nargs="?", help="the configuration stored in a python file, its samples are loaded by the server")
+	parser.add_argument("--socket", default=DEFAULT_SOCKET, help="unix socket of the server (default: %(default)s)")
+	parser.add_argument("--output-dir", default=".", help="the output files of the jobs are written below this directory")
+	parser.add_argument("--max-caches", type=int, default=4, help="number of preselections whose events are kept in memory")
+	parser.add_argument("--submit", metavar="JOB", help="send the job (a json file, - for stdin) to a running server and print the results")
+	parser.add_argument("--json", action="store_true", help="print the response of the server as json")
+	parser.add_argument("--shutdown", action="store_true", help="stop a running server")
+
+	opts = parser.parse_args()
+	if not (opts.configFile or opts.submit or opts.shutdown):
+		parser.error("either a config file (to start the server), --submit or --shutdown is needed")
+	return opts
+
+###############################
+
+def main():
+	opts = parse_options()
+
+	if opts.shutdown:
+		submit({}, opts.socket, "/shutdown")
+		return
+
+	if opts.submit:
+		jobFile = sys.stdin if opts.submit == "-" else open(opts.submit)
+		status, response = submit(json.load(jobFile), opts.socket)
+		if opts.json:
+			print json.dumps(response, indent=2)
+		else:
+			print response.get("log", "")
+			if "error" in response:
+				print "ERROR:", response["error"]
+		if status != 200:
+			sys.exit(1)
+		return
+
+	lazyRoot.batchMode(1001) # ignore INFO and below
+	config = configuration.load_config(opts.configFile)
+	optimisation.checkInputSettings(config)
+
+	optimiser = OptimisationServer(config, opts.max_caches, opts.output_dir)
+	for signal in optimiser.signals:
+		optimiser.getCache(config.preselection, list(config.Variables), signal)
+	serve(optimiser, opts.socket)
+
+###############################
+
+if __name__ == '__main__':
+	main()
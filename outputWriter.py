@@ -0,0 +1,171 @@
+import sys
+import threading
+import Queue
+
+from lazyRoot import ROOT
+import histogram
+
+###############################
+# the output ROOT file is written by a separate thread, such that the optimisation does not wait for the file system
+# the writes are queued and done in the order in which they were requested, the file is only used by the writer thread
+# the objects are cloned before they are queued, because ROOT reuses histograms with the same name in the next iteration
+# a process must not be forked while the writer thread is inside ROOT (it could hold the lock of ROOT, the child would
+# wait for it forever), so the queue is written before process pools are started (see drainWriters)
+
+CLOSE = None
+
+_WRITERS = [] # the open writers with a background thread
+
+def drainWriters():
+	# waits until all queued objects are written, called before forking
+	for writer in _WRITERS:
+		writer.drain()
+
+def releaseGIL(method):
+	# PyROOT keeps the python lock during C++ calls unless this is requested for the method
+	for attribute in ["_threaded", "__release_gil__"]:
+		try:
+			setattr(method, attribute, True)
+		except (AttributeError, TypeError):
+			pass
+
+def detach(obj):
+	clone = obj.Clone()
+	if hasattr(clone, "SetDirectory"):
+		clone.SetDirectory(0)
+	return clone
+
+###############################
+
+class OutputDirectory(object):
+	# a directory of the output file, it has the same interface as a TDirectory for the methods used by the optimisation
+	def __init__(self, writer, path):
+		self.writer = writer
+		self.path = path
+
+	def mkdir(self, name):
+		path = self.path + "/" + name if self.path else name
+		self.writer.put(("mkdir", path, None, None))
+		return OutputDirectory(self.writer, path)
+
+	def WriteTObject(self, obj, name):
+		self.writer.put(("write", self.path, detach(obj), name))
+
+	def Flush(self):
+		self.writer.put(("flush", None, None, None))
+
+class OutputWriter(OutputDirectory):
+	def __init__(self, filename, background=True):
+		OutputDirectory.__init__(self, self, "")
+		self.filename = filename
+		self.background = background
+		self.rFile = None
+		self.error = None
+		self.closed = False
+
+		if not background:
+			self.open()
+			return
+
+		ROOT.EnableThreadSafety()
+		self.queue = Queue.Queue()
+		opened = threading.Event()
+		self.thread = threading.Thread(target=self.run, args=(opened,), name="OutputWriter")
+		self.thread.daemon = True
+		self.thread.start()
+
+		# the file is opened by the writer thread, errors are reported here
+		opened.wait()
+		self.checkError()
+		_WRITERS.append(self)
+
+	def open(self):
+		self.rFile = ROOT.TFile(self.filename, "RECREATE")
+		if not self.rFile or self.rFile.IsZombie():
+			raise IOError("the output file " + self.filename + " could not be created")
+		for method in [ROOT.TDirectoryFile.WriteTObject, ROOT.TDirectoryFile.mkdir, ROOT.TFile.Flush, ROOT.TFile.Close]:
+			releaseGIL(method)
+
+	def run(self, opened):
+		try:
+			self.open()
+		except Exception:
+			self.error = sys.exc_info()
+			return
+		finally:
+			opened.set()
+
+		while True:
+			task = self.queue.get()
+			if task is CLOSE:
+				break
+			# after an error the remaining writes are skipped, the error is raised in the main thread
+			if not self.error:
+				try:
+					self.execute(task)
+				except Exception:
+					self.error = sys.exc_info()
+			self.queue.task_done()
+
+		self.rFile.Close()
+
+	def execute(self, task):
+		command, path, obj, name = task
+		if command == "mkdir":
+			parent, sep, child = path.rpartition("/")
+			directory = self.rFile.GetDirectory(parent) if parent else self.rFile
+			directory.mkdir(child)
+		elif command == "write":
+			directory = self.rFile.GetDirectory(path) if path else self.rFile
+			directory.WriteTObject(histogram.toROOT(obj), name)
+		elif command == "flush":
+			self.rFile.Flush()
+
+	def checkError(self):
+		if self.error:
+			errorType, value, traceback = self.error
+			self.error = None
+			raise errorType, value, traceback
+
+	def put(self, task):
+		if self.closed:
+			raise IOError("the output file " + self.filename + " is already closed")
+		if not self.background:
+			self.execute(task)
+			return
+		self.checkError()
+		self.queue.put(task)
+
+	def drain(self):
+		# the writer thread is idle afterwards, waiting for the next task
+		if self.background and not self.closed:
+			self.queue.join()
+			self.checkError()
+
+	def Close(self):
+		# waits until all queued objects are written
+		if self.closed:
+			return
+		self.closed = True
+		if not self.background:
+			self.rFile.Close()
+			return
+		if self in _WRITERS:
+			_WRITERS.remove(self)
+		self.queue.put(CLOSE)
+		self.thread.join()
+		self.checkError()
+
+class NullOutput(object):
+	# the same interface as the OutputWriter, but nothing is stored (e.g. for the jobs of the optimisation server)
+	def mkdir(self, name):
+		return self
+
+	def WriteTObject(self, obj, name):
+		pass
+
+	def Flush(self):
+		pass
+
+	def Close(self):
+		pass
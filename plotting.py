@@ -0,0 +1,225 @@
+import os
+import pickle
+import multiprocessing
+from collections import namedtuple
+
+import lazyRoot
+from lazyRoot import ROOT
+import PlotStyle
+import histogram
+import profiling
+
+###############################
+# the plots of the CutFinder are drawn and saved by worker processes, such that the optimisation does not wait for them
+# the histograms and graphs are pickled when the plot is requested, later changes of the objects are not seen by the workers
+
+Plot = namedtuple("Plot", "kind var args")
+
+def outputname(name):
+	BAD = "[]$,"
+	for b in BAD:
+		name = name.replace(b,"_")
+	return name
+
+def ensure_dir(d):
+	if not os.path.exists(d):
+		os.makedirs(d)
+
+def saveCanv(var, canv, directory, append=None, rootFile=False):
+	name = var
+	if append:
+		name = name + "_" + append
+
+	with profiling.timer("plotting"):
+		ensure_dir(directory)
+		canv.SaveAs(os.path.join(directory, outputname(name) + ".png"))
+		ensure_dir(directory + "/pdf")
+		canv.SaveAs(os.path.join(directory, "pdf", outputname(name) + ".pdf"))
+		if rootFile:
+			ensure_dir(directory + "/root")
+			canv.SaveAs(os.path.join(directory, "root", outputname(name) + ".root"))
+
+###############################
+# each function draws one plot and returns the canvas and the objects which have to be kept until it is saved
+
+def drawVarDistribution(var, sigHist, bkgHistList):
+	sigHist = histogram.toROOT(sigHist)
+	bkgHistList = [histogram.toROOT(hist) for hist in bkgHistList]
+	sigHist.SetLineColor(ROOT.kRed + 1)
+	sigHist.SetLineWidth(3)
+
+	bkgHist = None
+	for hist in bkgHistList:
+		if not bkgHist:
+			bkgHist = hist.Clone()
+		else:
+			bkgHist.Add(hist)
+
+	bkgHist.SetLineColor(ROOT.kBlue + 2)
+	bkgHist.SetLineWidth(3)
+
+	leg = ROOT.TLegend(0.7, 0.7, 0.9, 0.9)
+	leg.SetFillColor(ROOT.kWhite)
+	leg.AddEntry(sigHist, "signal", "L")
+	leg.AddEntry(bkgHist, "background", "L")
+
+	stack = ROOT.THStack()
+	stack.Add(sigHist, "hist")
+	stack.Add(bkgHist, "hist")
+	stack.SetTitle(";" + var + "; # events")
+
+	c = ROOT.TCanvas("plotVar", "", 600, 600)
+	c.SetLogy()
+	stack.Draw("nostack")
+	leg.Draw("same")
+
+	return c, [sigHist, bkgHist, leg, stack]
+
+def drawRating(var, title, points):
+	# points: list of (cut value, rating)
+	graph = ROOT.TGraph()
+	for i, (x, y) in enumerate(points):
+		graph.SetPoint(i, x, y)
+	graph.SetLineWidth(3)
+	graph.SetTitle(";" + var + ";" + title)
+
+	c = ROOT.TCanvas("plotRating", "", 600, 600)
+	graph.Draw("al")
+
+	return c, [graph]
+
+def drawWindowRating(var, title, nbins, minV, maxV, first, last, ratings):
+	# the rating of the window of the bins first .. last
+	ratingHist = ROOT.TH2D("windowRating", ";" + var + " low;" + var + " high;" + title, nbins, minV, maxV, nbins, minV, maxV)
+	for i in xrange(len(first)):
+		ratingHist.SetBinContent(int(first[i]), int(last[i]), ratings[i])
+
+	c = ROOT.TCanvas("plotWindowRating", "", 600, 600)
+	ratingHist.Draw("colz")
+
+	return c, [ratingHist]
+
+# kind -> (draw function, suffix of the file name)
+PLOTS = {
+	"var": (drawVarDistribution, None),
+	"rating": (drawRating, "rat"),
+	"window": (drawWindowRating, "rat"),
+}
+
+def renderPlots(plots, directory, pdfName=None):
+	# saves each plot as png and pdf, or all of them as pages of one pdf file
+	with profiling.timer("plotting"):
+		if pdfName:
+			ensure_dir(directory)
+			path = os.path.join(directory, pdfName)
+
+		for i, plot in enumerate(plots):
+			draw, append = PLOTS[plot.kind]
+			canv, objects = draw(plot.var, *plot.args)
+			if not pdfName:
+				saveCanv(plot.var, canv, directory, append)
+				continue
+
+			# the first page opens the file, the last page closes it
+			suffix = ""
+			if len(plots) > 1 and i == 0:
+				suffix = "("
+			elif len(plots) > 1 and i == len(plots) - 1:
+				suffix = ")"
+			canv.Print(path + suffix, "Title:" + plot.var + (" " + append if append else ""))
+
+def initPlotWorker():
+	lazyRoot.batchMode(1001)
+
+def renderPlotsWorker(args):
+	data, directory, pdfName = args
+	renderPlots(pickle.loads(data), directory, pdfName)
+
+###############################
+
+class PlotPool(object):
+	# nProcesses = 0: the plots are made directly by the calling process
+	# multiPage: the plots of each iteration are collected in one pdf file, e.g. plots/iteration_3.pdf
+	def __init__(self, nProcesses=2, directory="plots", multiPage=False):
+		self.directory = directory
+		self.multiPage = multiPage
+		self.maxPending = 4 * max(1, nProcesses) # the optimisation waits if the workers fall behind, such that the memory is limited
+		self.pool = None
+		if nProcesses > 0:
+			self.pool = multiprocessing.Pool(nProcesses, initializer=initPlotWorker)
+		self.pending = []
+		self.iteration = None
+		self.pages = []
+		self.pdfNames = set()
+
+	def add(self, iteration, plot):
+		if not self.multiPage:
+			self.submit([plot], None)
+			return
+
+		if iteration != self.iteration:
+			self.flush()
+			self.iteration = iteration
+		self.pages.append(plot)
+
+	def addAll(self, plots):
+		# list of (iteration, plot), e.g. collected by a PlotCollector in another process
+		for iteration, plot in plots:
+			self.add(iteration, plot)
+
+	def flush(self):
+		# the pages of the current iteration are written to their pdf file
+		if not self.pages:
+			return
+		pdfName = "iteration_" + str(self.iteration)
+		# the iterations start again for each signal point, the earlier files are not overwritten
+		i = 1
+		while pdfName in self.pdfNames:
+			pdfName = "iteration_" + str(self.iteration) + "_" + str(i)
+			i += 1
+		self.pdfNames.add(pdfName)
+		self.submit(self.pages, pdfName + ".pdf")
+		self.pages = []
+
+	def submit(self, plots, pdfName):
+		if not self.pool:
+			renderPlots(plots, self.directory, pdfName)
+			return
+
+		# the objects are pickled now, the optimisation may change them afterwards
+		data = pickle.dumps(plots, pickle.HIGHEST_PROTOCOL)
+		self.pending.append(self.pool.apply_async(renderPlotsWorker, [(data, self.directory, pdfName)]))
+		while len(self.pending) > self.maxPending:
+			with profiling.timer("waiting for plots"):
+				self.pending.pop(0).get()
+		# finished plots are removed, errors of the workers are raised here
+		while self.pending and self.pending[0].ready():
+			self.pending.pop(0).get()
+
+	def close(self):
+		# waits until all plots are saved
+		self.flush()
+		if not self.pool:
+			return
+		with profiling.timer("waiting for plots"):
+			try:
+				for result in self.pending:
+					result.get()
+			finally:
+				self.pending = []
+				self.pool.close()
+				self.pool.join()
+				self.pool = None
+
+class PlotCollector(object):
+	# used in worker processes, which cannot start further processes: the plots are returned to the main process
+	def __init__(self):
+		self.plots = []
+
+	def add(self, iteration, plot):
+		self.plots.append((iteration, plot))
+
+	def take(self):
+		plots = self.plots
+		self.plots = []
+		return plots
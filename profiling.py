@@ -0,0 +1,88 @@
+import time
+import json
+from contextlib import contextmanager
+
+from tabulate import tabulate
+
+###############################
+# timers and counters for the expensive parts of the optimisation, they are collected per iteration
+# only the main process is counted, the work done in worker processes is included in the time of the caller
+
+COUNTERS = ["events read", "Draw calls", "bytes read", "histograms created"]
+
+_iteration = 0
+_timers = {} # (iteration, name) -> [seconds, calls]
+_counters = {} # (iteration, name) -> value
+_running = set() # names of the timers which are currently running
+
+def reset():
+	global _iteration
+	_iteration = 0
+	_timers.clear()
+	_counters.clear()
+	_running.clear()
+
+def setIteration(iteration):
+	global _iteration
+	_iteration = iteration
+
+@contextmanager
+def timer(name):
+	# nested calls of the same timer (e.g. recursion) are only counted once
+	if name in _running:
+		yield
+		return
+
+	_running.add(name)
+	start = time.time()
+	try:
+		yield
+	finally:
+		_running.discard(name)
+		entry = _timers.setdefault((_iteration, name), [0., 0])
+		entry[0] += time.time() - start
+		entry[1] += 1
+
+def count(name, n=1):
+	_counters[(_iteration, name)] = _counters.get((_iteration, name), 0) + n
+
+###############################
+
+def getReport():
+	iterations = sorted(set(key[0] for key in _timers.keys() + _counters.keys()))
+	timerNames = sorted(set(name for iteration, name in _timers))
+
+	report = {"iterations": [], "timers": {}, "counters": {}}
+	for iteration in iterations:
+		report["iterations"].append({
+			"iteration": iteration,
+			"timers": dict((name, {"seconds": seconds, "calls": calls}) for (i, name), (seconds, calls) in _timers.iteritems() if i == iteration),
+			"counters": dict((name, value) for (i, name), value in _counters.iteritems() if i == iteration),
+		})
+
+	for name in timerNames:
+		entries = [entry for (iteration, timerName), entry in _timers.iteritems() if timerName == name]
+		report["timers"][name] = {"seconds": sum(e[0] for e in entries), "calls": sum(e[1] for e in entries)}
+	for name in set(name for iteration, name in _counters):
+		report["counters"][name] = sum(value for (iteration, counterName), value in _counters.iteritems() if counterName == name)
+
+	return report
+
+def printSummary():
+	report = getReport()
+
+	print "\n\nPROFILE\n"
+	table = []
+	for name, timer in sorted(report["timers"].iteritems(), key=lambda item: -item[1]["seconds"]):
+		table.append([name, timer["calls"], timer["seconds"], 1e3 * timer["seconds"] / max(1, timer["calls"])])
+	print tabulate(table, headers=["section", "calls", "total time [s]", "time per call [ms]"], tablefmt="simple")
+
+	print
+	table = []
+	for entry in report["iterations"]:
+		table.append([entry["iteration"]] + [entry["counters"].get(name, 0) for name in COUNTERS])
+	print tabulate(table, headers=["iteration"] + COUNTERS, tablefmt="simple")
+
+def writeReport(filename):
+	with open(filename, "w") as output:
+		json.dump(getReport(), output, indent=2, sort_keys=True)
@@ -1,14 +1,16 @@
 #!/usr/bin/env python
 import sys
 import os
-
-from ROOT import *
-import PlotStyle
+import multiprocessing
 
 from tabulate import tabulate
 from ratingMethods import *
 from getOptimalCut import CutFinder
+from plotting import PlotCollector
 import utils
+import profiling
+import outputWriter
+import lazyRoot
 
 ###############################
 
@@ -19,7 +21,8 @@ def scale(hist):
 
 ###############################
 
-Rating = namedtuple("Rating", "var cut rating lower_cut sigHist bkgHist nEvents_sig nEvents_bkg")
+Rating = namedtuple("Rating", "var cut rating lower_cut sigHist bkgHist nEvents_sig nEvents_bkg cutSpread ratingSpread separation")
+Rating.__new__.__defaults__ = (None, None, None) # the spread over the bootstrap replicas of the CutFinder, the Separation for the ranking methods
 
 ###############################
 
@@ -42,6 +45,28 @@ def initCutFinder(finder, ranker):
 
 ###############################
 
+# the ranker used by the worker processes, it is inherited when the processes are forked
+_PARALLEL_RANKER = None
+
+def initRankWorker():
+	# every worker opens its own chains, the ROOT files are not shared with the other processes
+	_PARALLEL_RANKER.finder.reopenChains()
+	# a worker process cannot start further processes
+	_PARALLEL_RANKER.finder.nFillProcesses = 1
+	# the plots are returned to the main process, which hands them to its plotting processes
+	if _PARALLEL_RANKER.finder.plotter:
+		_PARALLEL_RANKER.finder.plotter = PlotCollector()
+
+def rateVariablesWorker(args):
+	items, iteration = args
+	ratings = _PARALLEL_RANKER.rateVariables(items, iteration)
+	plots = []
+	if _PARALLEL_RANKER.finder.plotter:
+		plots = _PARALLEL_RANKER.finder.plotter.take()
+	return ratings, plots
+
+###############################
+
 class VariableRanker(object):
 	def __init__(self):
 		self.signal = None
@@ -59,11 +84,78 @@ class VariableRanker(object):
 		self.useGetOptimalCut = False
 		self.finder = None
 		self.includeMCstat = False
+		self.nProcesses = 1
+		self.lastCutVar = None # the variable of the cut applied in the step before
 
 	def rankVariables(self, variables, iteration=0):
+		with profiling.timer("rankVariables"):
+			if self.nProcesses > 1:
+				varRating = self.rateVariablesParallel(variables.items(), iteration)
+			else:
+				varRating = self.rateVariables(variables.items(), iteration)
+
+		# further ranking methods (e.g. TMVA methods) can be added to METHODS_RANK, they are rated with calc_batch in getRatings
+
+		order = self.method.rank([rating.rating for rating in varRating])
+		varRating = [varRating[i] for i in order]
+
+		table = []
+		header = None
+		if self.useGetOptimalCut:
+			header = ["variable name", "cut value", self.method.title, "signal", "background"]
+			for rating in varRating:
+				table.append([rating.var, rating.cut, rating.rating, rating.nEvents_sig, rating.nEvents_bkg])
+			if any(rating.cutSpread is not None for rating in varRating):
+				header += ["cut spread", self.method.title + " spread"]
+				for row, rating in zip(table, varRating):
+					row += [rating.cutSpread, rating.ratingSpread]
+		else:
+			# the other separations are shown next to the rating
+			fields = [field for field in Separation._fields if SEPARATION_TITLES[field] != self.method.title]
+			header = ["variable name", self.method.title] + [SEPARATION_TITLES[field] for field in fields]
+			for rating in varRating:
+				table.append([rating.var, rating.rating] + [getattr(rating.separation, field) for field in fields])
+		print tabulate(table, headers=header, tablefmt="simple")
+
+		return varRating
+
+	def rateVariablesParallel(self, items, iteration):
+		# each process rates a contiguous part of the variables, so the ratings are returned in the same order as for one process
+		global _PARALLEL_RANKER
+		_PARALLEL_RANKER = self
+
+		nProcesses = min(self.nProcesses, len(items))
+		chunkSize = (len(items) + nProcesses - 1) / nProcesses
+		chunks = [items[i:i+chunkSize] for i in xrange(0, len(items), chunkSize)]
+
+		outputWriter.drainWriters()
+		pool = multiprocessing.Pool(nProcesses, initializer=initRankWorker)
+		try:
+			results = pool.map(rateVariablesWorker, [(chunk, iteration) for chunk in chunks])
+		finally:
+			pool.close()
+			pool.join()
+			_PARALLEL_RANKER = None
+
+		if self.finder.plotter:
+			for ratings, plots in results:
+				self.finder.plotter.addAll(plots)
+		return [rating for ratings, plots in results for rating in ratings]
+
+	def rateVariables(self, items, iteration):
+		# items: list of (var, rangeDef), the ratings are returned in the same order
 		varRating = []
 
-		for var, rangeDef in variables.iteritems():
+		# all variables are filled with one pass over each chain
+		with profiling.timer("fillHistograms"):
+			hists = self.finder.fillHistograms(utils.getBinnings(dict(items)))
+
+		# the ranking methods rate all variables with one call
+		ranking = {}
+		if not self.useGetOptimalCut:
+			ranking = self.getRatings([(var, hists[var]) for var, rangeDef in items])
+
+		for var, rangeDef in items:
 			cut = None
 			rating = None
 			storeVar = True
@@ -71,63 +163,61 @@ class VariableRanker(object):
 			nEvents_bkg = -1
 			sigHist = None
 			bkgHist = None
+			cutSpread = None
+			ratingSpread = None
+			separation = None
 
 			if self.useGetOptimalCut:
-				result = self.finder.getOptimalCut(var, rangeDef.nBins, rangeDef.min, rangeDef.max, rangeDef.lower_cut, iteration)
+				result = self.finder.getOptimalCut(var, rangeDef.nBins, rangeDef.min, rangeDef.max, rangeDef.lower_cut, iteration, hists[var])
 				cut = result.cutValue
 				rating = result.rating
 				nEvents_bkg = result.nEvents_bkg
 				nEvents_sig = result.nEvents_sig
 				sigHist = result.sigHist
 				bkgHist = result.bkgHist
+				cutSpread = result.cutSpread
+				ratingSpread = result.ratingSpread
 			else:
-				rating, storeVar, sigHist, bkgHist = self.getRating(var, rangeDef.nBins, rangeDef.min, rangeDef.max)
+				rating, storeVar, sigHist, bkgHist, separation = ranking[var]
 
 			if storeVar:
-				varRating.append(Rating(var, cut, rating, rangeDef.lower_cut, sigHist, bkgHist, nEvents_sig, nEvents_bkg))
+				varRating.append(Rating(var, cut, rating, rangeDef.lower_cut, sigHist, bkgHist, nEvents_sig, nEvents_bkg, cutSpread, ratingSpread, separation))
 				# the variable should generally be stored
-			elif (not storeVar) and (var != lastCutVar):
-				varRating.append(Rating(var, cut, rating, rangeDef.lower_cut, sigHist, bkgHist, nEvents_sig, nEvents_bkg))
+			elif (not storeVar) and (var != self.lastCutVar):
+				varRating.append(Rating(var, cut, rating, rangeDef.lower_cut, sigHist, bkgHist, nEvents_sig, nEvents_bkg, cutSpread, ratingSpread, separation))
 				# the variable should not be stored for some methods, when it is not used for the ranking
 				# e.g. for overlap
 
-		# how to handle other ranking methods, e.g. TMVA methods
-
-		varRating.sort(cmp=lambda a, b: self.method.compare(a.rating, b.rating) and -1 or 1)
-
-		table = []
-		header = None
-		if self.useGetOptimalCut:
-			header = ["variable name", "cut value", self.method.title, "signal", "background"]
-			for rating in varRating:
-				table.append([rating.var, rating.cut, rating.rating, rating.nEvents_sig, rating.nEvents_bkg])
-		else:
-			header = ["variable name", self.method.title]
-			for rating in varRating:
-				table.append([rating.var, rating.rating])
-		print tabulate(table, headers=header, tablefmt="simple")
-
 		return varRating
 
-	def getRating(self, var, nbins, minV, maxV):
-		sigHist = utils.getHistogram(var, nbins, minV, maxV, self.signal, self.event_weight, self.signal_scale, "sig", self.preselection, self.lumi)
-		bkgHist = None
-
-		# if background scale list is not initialized, just fill it with 1.
-		if not self.backgrounds_scale:
-			for i in xrange(len(self.backgrounds)):
-				self.backgrounds_scale.append(1.0)
-
-		for i, bkgTree in enumerate(self.backgrounds):
-			if not bkgHist:
-				bkgHist = utils.getHistogram(var, nbins, minV, maxV, bkgTree, self.event_weight, self.backgrounds_scale[i], "bkg_" + str(i), self.preselection, self.lumi)
-			else:
-				bkgHist.Add(utils.getHistogram(var, nbins, minV, maxV, bkgTree, self.event_weight, self.backgrounds_scale[i], "bkg_" + str(i), self.preselection, self. lumi))
-
-		sigHist = scale(sigHist)
-		bkgHist = scale(bkgHist)
-		
-		rating = self.method.calc(sigHist, bkgHist)
+	def getRating(self, var, nbins, minV, maxV, hists=None):
+		if not hists:
+			hists = self.finder.fillHistograms({var: (nbins, minV, maxV)})[var]
+		return self.getRatings([(var, hists)])[var]
+
+	def getRatings(self, varHists):
+		# varHists: list of (var, hists), returns a dict var -> (rating, storeVar, sigHist, bkgHist, separation)
+		# the normalised distributions of all variables are rated at once
+		sigHists = []
+		bkgHists = []
+		for var, hists in varHists:
+			bkgHist = None
+			for hist in hists.bkgHistList:
+				if not bkgHist:
+					bkgHist = hist.Clone()
+				else:
+					bkgHist.Add(hist)
+
+			sigHists.append(scale(hists.sigHist))
+			bkgHists.append(scale(bkgHist))
+
+		sigArrays = [hist.getArrays()[0] for hist in sigHists]
+		bkgArrays = [hist.getArrays()[0] for hist in bkgHists]
+		separations = calcSeparations(sigArrays, bkgArrays)
+		if self.method.name in SEPARATION_FIELDS:
+			ratings = getattr(separations, SEPARATION_FIELDS[self.method.name])
+		else:
+			ratings = self.method.calc_batch(sigArrays, bkgArrays)
 
 		storeVar = True
 		if self.method.title == "overlap":
@@ -136,7 +226,11 @@ class VariableRanker(object):
 			# overlap sometimes wants to cut at the same variable as in the step before
 			# this stops the optimisation
 
-		return rating, storeVar, sigHist, bkgHist
+		result = {}
+		for i, (var, hists) in enumerate(varHists):
+			separation = Separation(*[float(values[i]) for values in separations])
+			result[var] = (float(ratings[i]), storeVar, sigHists[i], bkgHists[i], separation)
+		return result
 
 ###############################
 
@@ -147,7 +241,7 @@ def parse_options():
 
         parser.add_argument("--enable-plots", action="store_true", help="save all plots")
         parser.add_argument("-p", "--preselection", action="append", default="1", help="preselection for ranges which should not be used for the optimisation (e.g. CR)")
-        parser.add_argument("-m", "--method", choices=[m.name for m in METHODS], default="sig", help="which method should be used for the optimisation")
+        parser.add_argument("-m", "--method", choices=[m.name for m in METHODS + METHODS_RANK], default="sig", help="which method should be used for the optimisation")
         parser.add_argument("--tree-name", default="CollectionTree", help="tree name for the input file (must be the same for signal and bkg")
         parser.add_argument("--event-weight", default="1.", help="name for the stored event weight")
         parser.add_argument("-l", "--lumi", default=10e3, help="the luminosity which should be used")
@@ -174,7 +268,7 @@ def parse_options():
 ###############################
 
 def main():
-	gROOT.SetBatch(True)
+	lazyRoot.batchMode()
 	opts = parse_options()
 
 	signal = utils.load_chain([opts.signal], opts.tree_name, print_files=True)
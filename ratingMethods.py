@@ -1,8 +1,42 @@
 from collections import namedtuple
 import math
-from ROOT import *
+import numpy
 
-RatingMethod = namedtuple("RatingMethod", "name title calc compare")
+from lazyRoot import ROOT
+import mathUtils
+
+# calc: rating of a single cut (or a single pair of histograms for the ranking methods)
+# calc_batch: the same for whole numpy arrays
+# best: index of the best rating of an array (optionally only among the valid entries)
+# rank: indices sorting an array of ratings from the best to the worst
+RatingMethod = namedtuple("RatingMethod", "name title calc compare calc_batch best rank")
+
+###############################
+
+def asRatings(ratings):
+	# missing ratings (None) are never the best
+	return numpy.array([numpy.nan if r is None else r for r in numpy.ravel(ratings)], dtype=numpy.float64).reshape(numpy.shape(ratings))
+
+def bestMaximum(ratings, valid=None):
+	ratings = asRatings(ratings)
+	candidates = ~numpy.isnan(ratings)
+	if valid is not None:
+		candidates &= valid
+	candidates = numpy.flatnonzero(candidates)
+	if not len(candidates):
+		return None
+	# argmax returns the first of equal ratings, the same as the bin loop in the CutFinder
+	return int(candidates[numpy.argmax(ratings.flat[candidates])])
+
+def bestMinimum(ratings, valid=None):
+	return bestMaximum(-asRatings(ratings), valid)
+
+def rankMaximum(ratings):
+	# a stable sort, NaN (missing ratings) are sorted to the end
+	return numpy.argsort(-asRatings(ratings), kind="mergesort")
+
+def rankMinimum(ratings):
+	return numpy.argsort(asRatings(ratings), kind="mergesort")
 
 ###############################
 
@@ -15,33 +49,137 @@ def calcSig(sig_nEvents, bkg_nEvents, bkgUnc=None):
 	else:
 		return 0
 
+def calcSigBatch(sig_nEvents, bkg_nEvents, bkgUnc=None):
+	sig_nEvents = numpy.asarray(sig_nEvents, dtype=numpy.float64)
+	bkg_nEvents = numpy.asarray(bkg_nEvents, dtype=numpy.float64)
+	if bkgUnc is None:
+		bkgUnc = 0.
+
+	empty = (bkg_nEvents == 0)
+	variance = numpy.where(empty, 1., bkg_nEvents + (bkgUnc*bkg_nEvents))
+	return numpy.where(empty, 0., sig_nEvents / numpy.sqrt(variance))
+
 def compSig(sigA, sigB):
 	return sigA > sigB
 
 ###############################
 
+# separation power of the signal and background distributions of many variables at once, for the ranking methods
+# the distributions are normalised here (including the under- and overflow), the ratings do not depend on the luminosity
+Separation = namedtuple("Separation", "overlap auc ks separation")
+SEPARATION_TITLES = {"overlap": "overlap", "auc": "ROC AUC", "ks": "KS distance", "separation": "separation"}
+# the field of the Separation rated by each method of METHODS_RANK
+SEPARATION_FIELDS = {"ovlap": "overlap", "auc": "auc", "ks": "ks", "sep": "separation"}
+
+def asBinArrays(arrays):
+	# one array (nVariables, nBins) for a list of bin contents of different lengths,
+	# the shorter ones are padded with empty bins at the end, which do not change any of the separations
+	if isinstance(arrays, numpy.ndarray):
+		return numpy.atleast_2d(numpy.asarray(arrays, dtype=numpy.float64))
+	arrays = [numpy.ravel(numpy.asarray(a, dtype=numpy.float64)) for a in arrays]
+	padded = numpy.zeros((len(arrays), max(len(a) for a in arrays)))
+	for i, a in enumerate(arrays):
+		padded[i, :len(a)] = a
+	return padded
+
+def normalise(arrays):
+	# an empty distribution stays empty
+	total = arrays.sum(axis=-1)[..., numpy.newaxis]
+	return arrays / numpy.where(total != 0, total, 1.)
+
+def calcSeparations(sig_arrays, bkg_arrays):
+	# sig_arrays, bkg_arrays: bin contents of each variable (including under- and overflow, e.g. from utils.getBinArrays),
+	# as array (nVariables, nBins) or as list of arrays with different numbers of bins
+	# every field of the result is an array with one value per variable:
+	# overlap: area of both distributions in common, one for identical distributions, zero if they do not overlap
+	# auc: area under the ROC curve of the better cut direction, 0.5 for identical distributions, one if they are separated
+	# ks: Kolmogorov-Smirnov distance, largest difference of the cumulative distributions
+	# separation: <S^2> = 1/2 sum (s - b)^2 / (s + b), as in TMVA
+	# without signal or background events in the histogram all of them are NaN, such variables are ranked last
+	sig = normalise(asBinArrays(sig_arrays))
+	bkg = normalise(asBinArrays(bkg_arrays))
+	empty = (sig.sum(axis=-1) == 0) | (bkg.sum(axis=-1) == 0)
+
+	overlap = numpy.minimum(sig, bkg).sum(axis=-1)
+
+	sigCum = numpy.cumsum(sig, axis=-1)
+	bkgCum = numpy.cumsum(bkg, axis=-1)
+	# probability that a signal event is above a background event, events in the same bin count one half
+	auc = (sig * (bkgCum - 0.5 * bkg)).sum(axis=-1)
+	auc = numpy.maximum(auc, 1. - auc)
+
+	ks = numpy.abs(sigCum - bkgCum).max(axis=-1)
+
+	total = sig + bkg
+	separation = 0.5 * numpy.where(total > 0, (sig - bkg)**2 / numpy.where(total > 0, total, 1.), 0.).sum(axis=-1)
+
+	return Separation(*[numpy.where(empty, numpy.nan, values) for values in (overlap, auc, ks, separation)])
+
+def calcSeparation(sigHist, bkgHist):
+	# the separations of a single variable
+	separations = calcSeparations([sigHist.getArrays()[0]], [bkgHist.getArrays()[0]])
+	return Separation(*[float(v[0]) for v in separations])
+
 def calcOverlap(sigHist, bkgHist, bkgUnc=None):
-	# this value should be one when both distributions are identical
-	# this value should be zero if both distributions do not overlap
-	envelope = sigHist.Clone()
-	for ibin in xrange(envelope.GetNbinsX()):
-		if envelope.GetBinContent(ibin) < bkgHist.GetBinContent(ibin):
-			envelope.SetBinContent(ibin, bkgHist.GetBinContent(ibin))
-			# if some error calculation is needed, change also the bin error
-
-	integral = envelope.Integral()
-	# if both distributions do not overlap, the integral is two
-	# if both distributions are completly identical, the integral is one
-	# (both signal and bkg are normalised to unity)
-	return (2. - integral)
+	return calcSeparation(sigHist, bkgHist).overlap
+
+def calcOverlapBatch(sig_arrays, bkg_arrays, bkgUnc=None):
+	return calcSeparations(sig_arrays, bkg_arrays).overlap
 
 def compOverlap(areaA, areaB):
 	return areaA < areaB
 
+def calcAUC(sigHist, bkgHist, bkgUnc=None):
+	return calcSeparation(sigHist, bkgHist).auc
+
+def calcAUCBatch(sig_arrays, bkg_arrays, bkgUnc=None):
+	return calcSeparations(sig_arrays, bkg_arrays).auc
+
+def calcKS(sigHist, bkgHist, bkgUnc=None):
+	return calcSeparation(sigHist, bkgHist).ks
+
+def calcKSBatch(sig_arrays, bkg_arrays, bkgUnc=None):
+	return calcSeparations(sig_arrays, bkg_arrays).ks
+
+def calcSeparationPower(sigHist, bkgHist, bkgUnc=None):
+	return calcSeparation(sigHist, bkgHist).separation
+
+def calcSeparationPowerBatch(sig_arrays, bkg_arrays, bkgUnc=None):
+	return calcSeparations(sig_arrays, bkg_arrays).separation
+
+def compSeparation(sepA, sepB):
+	return sepA > sepB
+
 ###############################
 
 def calcRooStats(sig_nEvents, bkg_nEvents, bkgUnc=0.2):
-	return RooStats.NumberCountingUtils.BinomialExpZ(sig_nEvents, bkg_nEvents, bkgUnc)
+	return ROOT.RooStats.NumberCountingUtils.BinomialExpZ(sig_nEvents, bkg_nEvents, bkgUnc)
+
+def calcRooStatsBatch(sig_nEvents, bkg_nEvents, bkgUnc=0.2):
+	# the same as calcRooStats for arrays of signal, background and uncertainty
+	# Z of the binomial test: p = I_x(s + b, 1 / bkgUnc^2 + 1) with x = 1 / (1 + tau), tau = 1 / (b * bkgUnc^2)
+	sig_nEvents, bkg_nEvents, bkgUnc = numpy.broadcast_arrays(*[numpy.asarray(v, dtype=numpy.float64) for v in (sig_nEvents, bkg_nEvents, bkgUnc)])
+	# without background the significance is not defined, zero is returned (as for calcSig)
+	empty = (bkg_nEvents <= 0)
+	bkg = numpy.where(empty, 1., bkg_nEvents)
+
+	tau = 1. / bkg / (bkgUnc * bkgUnc)
+	pValue = mathUtils.betaIncomplete(1. / (1. + tau), sig_nEvents + bkg, bkg * tau + 1.)
+	return numpy.where(empty, 0., mathUtils.normalQuantileC(pValue))
+
+def checkRooStatsBatch(sig_nEvents, bkg_nEvents, bkgUnc=0.2):
+	# largest absolute difference between calcRooStatsBatch and RooStats
+	sig_nEvents, bkg_nEvents, bkgUnc = numpy.broadcast_arrays(*[numpy.asarray(v, dtype=numpy.float64) for v in (sig_nEvents, bkg_nEvents, bkgUnc)])
+	batch = calcRooStatsBatch(sig_nEvents, bkg_nEvents, bkgUnc)
+	maxDiff = 0.
+	for i in numpy.ndindex(batch.shape):
+		if bkg_nEvents[i] <= 0:
+			continue
+		value = calcRooStats(float(sig_nEvents[i]), float(bkg_nEvents[i]), float(bkgUnc[i]))
+		if value == batch[i]:
+			continue # also covers infinite significances
+		maxDiff = max(maxDiff, abs(batch[i] - value))
+	return maxDiff
 
 def compareRooStats(sigA, sigB):
 	return sigA > sigB
@@ -49,12 +187,15 @@ def compareRooStats(sigA, sigB):
 ###############################
 
 METHODS = [
-	RatingMethod("sig", "significane", calcSig, compSig),
-	RatingMethod("roostats", "roostats", calcRooStats, compareRooStats)
+	RatingMethod("sig", "significane", calcSig, compSig, calcSigBatch, bestMaximum, rankMaximum),
+	RatingMethod("roostats", "roostats", calcRooStats, compareRooStats, calcRooStatsBatch, bestMaximum, rankMaximum)
 ]
 
 METHODS_RANK = [
-	RatingMethod("ovlap", "overlap", calcOverlap, compOverlap)
+	RatingMethod("ovlap", "overlap", calcOverlap, compOverlap, calcOverlapBatch, bestMinimum, rankMinimum),
+	RatingMethod("auc", "ROC AUC", calcAUC, compSeparation, calcAUCBatch, bestMaximum, rankMaximum),
+	RatingMethod("ks", "KS distance", calcKS, compSeparation, calcKSBatch, bestMaximum, rankMaximum),
+	RatingMethod("sep", "separation", calcSeparationPower, compSeparation, calcSeparationPowerBatch, bestMaximum, rankMaximum)
 ]
 
 
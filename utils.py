@@ -1,5 +1,22 @@
-from ROOT import *
 import sys
+import re
+import multiprocessing
+import numpy
+
+from lazyRoot import ROOT
+from histogram import Histogram
+import bootstrap
+import profiling
+import outputWriter
+
+# value assigned to an expression which cannot be evaluated for an event (e.g. jet_pt[3] for three jets)
+MISSING_VALUE = -1e30
+
+# cut direction of a Range for which a window (low, high) is searched instead of a single cut value
+WINDOW = "window"
+
+# expression for the entry number, used for the bootstrap replica weights
+ENTRY = "Entry$"
 
 def sanitise(var):
 	# cleanup characters that may confuse root in histogram names
@@ -10,7 +27,40 @@ def sanitise(var):
 
 	return var
 
-def getHistogram(var, nBins, minV, maxV, tree, event_weight, extra_weight, name, preselection, lumi, nMCEvents=False):
+def cutExpression(var, lower_cut, cutValue):
+	# selection string of a cut, the cut value of a window is the pair (low, high)
+	if lower_cut == WINDOW:
+		low, high = cutValue
+		return "(" + var + ">" + str(low) + " && " + var + "<" + str(high) + ")"
+	cutDirectionString = "<" if lower_cut else ">"
+	return "(" + var + cutDirectionString + str(cutValue) + ")"
+
+def getEntriesToRead(tree):
+	# only the entries of the entry list (if set) are read, firstEntry and nEntries of TTree::Draw then count the entries of the list
+	elist = tree.GetEntryList()
+	if elist:
+		return elist.GetN()
+	return tree.GetEntries()
+
+def drawTree(tree, varexp, selection, option="", nEntries=None, firstEntry=0):
+	# all trees are read through this function, such that the reading is included in the profile
+	# nEntries: only the entries firstEntry .. firstEntry+nEntries-1 are read
+	nRead = getEntriesToRead(tree)
+	bytesRead = ROOT.TFile.GetFileBytesRead()
+
+	with profiling.timer("TTree::Draw"):
+		if nEntries is None:
+			nEvents = tree.Draw(varexp, selection, option)
+		else:
+			nRead = max(0, min(nRead - firstEntry, nEntries))
+			nEvents = tree.Draw(varexp, selection, option, nEntries, firstEntry)
+
+	profiling.count("Draw calls")
+	profiling.count("events read", nRead)
+	profiling.count("bytes read", ROOT.TFile.GetFileBytesRead() - bytesRead)
+	return nEvents
+
+def getHistogram(var, nBins, minV, maxV, tree, event_weight, extra_weight, name, preselection, lumi, nMCEvents=False, maxMemory=None):
 	draw_cmd = "{var}>>{hist}"
 	draw_cmd += "(" + str(nBins) + "," + str(minV) + "," + str(maxV) + ")"
 
@@ -19,8 +69,15 @@ def getHistogram(var, nBins, minV, maxV, tree, event_weight, extra_weight, name,
 		eventWeight = 1
 	name += "_" + sanitise(var)
 
-	nEvents = tree.Draw(draw_cmd.format(var=var, hist=name), str(eventWeight) + "*" + str(extra_weight) + "*(" + str(preselection) + ")", "e")
-	hist = gDirectory.Get(name)
+	# the histogram is filled while the tree is read, only the buffer of the tree depends on the number of events
+	chunkSize = getChunkSize(1, maxMemory)
+	if chunkSize:
+		tree.SetEstimate(chunkSize)
+
+	with profiling.timer("getHistogram"):
+		nEvents = drawTree(tree, draw_cmd.format(var=var, hist=name), str(eventWeight) + "*" + str(extra_weight) + "*(" + str(preselection) + ")", "e")
+	hist = ROOT.gDirectory.Get(name)
+	profiling.count("histograms created")
 
 	if not hist:
 		print "ERROR: ", var, " histogram could not be loaded correctly --> maybe it is empty?"
@@ -29,17 +86,308 @@ def getHistogram(var, nBins, minV, maxV, tree, event_weight, extra_weight, name,
 	if not nMCEvents:
 		hist.Scale(lumi)
 
-	hist.SetDirectory(gROOT)
+	hist.SetDirectory(ROOT.gROOT)
+
+	return hist
+
+def toArray(buf, n):
+	# copy a buffer returned by the tree, it is overwritten by the next Draw call
+	if n <= 0:
+		return numpy.zeros(0)
+	if hasattr(buf, "SetSize"):
+		buf.SetSize(n)
+	return numpy.frombuffer(buf, dtype=numpy.float64, count=n).copy()
+
+def readColumns(tree, expressions, selection, firstEntry=0, nEntries=None):
+	# evaluate all expressions with a single pass over the tree (or over nEntries entries starting at firstEntry)
+	# every expression is wrapped in Alt$, so that an event is not dropped for all columns
+	# when only one of them cannot be evaluated
+	varexp = ":".join("Alt$((%s),%s)" % (expr, MISSING_VALUE) for expr in expressions)
+
+	# only the entries of the entry list (if set) can pass the selection
+	estimate = getEntriesToRead(tree)
+	if nEntries is not None:
+		estimate = min(estimate, nEntries)
+	tree.SetEstimate(estimate + 1)
+	nRows = drawTree(tree, varexp, str(selection), "goff", nEntries, firstEntry)
+
+	if nRows < 0:
+		print "ERROR: ", varexp, " could not be evaluated"
+		sys.exit(1)
+
+	columns = [toArray(tree.GetVal(i), nRows) for i in xrange(len(expressions))]
+	return columns, toArray(tree.GetW(), nRows)
+
+def getChunkSize(nColumns, maxMemory):
+	# number of entries read at once, such that the buffers of the tree (8 bytes per column and the weight)
+	# and their copies stay below maxMemory (in bytes), None: everything is read at once
+	if not maxMemory:
+		return None
+	return max(1000, int(maxMemory / (16. * (nColumns + 1))))
+
+def readColumnChunks(tree, expressions, selection, maxMemory=None):
+	# yields the (columns, weights) of readColumns for consecutive ranges of entries
+	chunkSize = getChunkSize(len(expressions), maxMemory)
+	if not chunkSize:
+		yield readColumns(tree, expressions, selection)
+		return
+
+	for firstEntry in xrange(0, getEntriesToRead(tree), chunkSize):
+		yield readColumns(tree, expressions, selection, firstEntry, chunkSize)
+
+def readColumnsChunked(tree, expressions, selection, maxMemory=None):
+	# same result as readColumns, but the tree is read in chunks (only the final arrays have the full size)
+	chunks = list(readColumnChunks(tree, expressions, selection, maxMemory))
+	if not chunks:
+		return [numpy.zeros(0) for expr in expressions], numpy.zeros(0)
+	columns = [numpy.concatenate([chunkColumns[i] for chunkColumns, chunkWeights in chunks]) for i in xrange(len(expressions))]
+	return columns, numpy.concatenate([chunkWeights for chunkColumns, chunkWeights in chunks])
+
+def makeHistogram(name, nBins, minV, maxV, values, weights, replicaWeights=None):
+	# the histograms of the cut scan are numpy histograms, ROOT is not needed for them
+	# replicaWeights: (nReplicas, nEvents), the bootstrap replicas are filled as well
+	hist = Histogram(name, nBins, minV, maxV)
+	if replicaWeights is not None:
+		hist.replicas = numpy.zeros((len(replicaWeights), nBins + 2))
+	profiling.count("histograms created")
+
+	fillHistogram(hist, values, weights, replicaWeights)
 
 	return hist
 
+def fillHistogram(hist, values, weights, replicaWeights=None):
+	filled = values != MISSING_VALUE
+	nFilled = int(filled.sum())
+	if nFilled:
+		hist.FillN(nFilled, values[filled], weights[filled])
+		if replicaWeights is not None:
+			hist.fillReplicas(values[filled], weights[filled], replicaWeights[:, filled])
+
+def rebinHistogram(hist, ngroup):
+	# merges ngroup neighbouring bins into a new histogram, the given one is not changed
+	rebinned = hist.Rebin(ngroup, hist.GetName() + "_rebin" + str(ngroup))
+	profiling.count("histograms created")
+	return rebinned
+
+def getBinArrays(hist):
+	# contents and squared errors of all bins, including under- and overflow
+	if isinstance(hist, Histogram):
+		return hist.getArrays()
+	nBins = hist.GetNbinsX() + 2
+	contents = numpy.array([hist.GetBinContent(i) for i in xrange(nBins)])
+	errors2 = numpy.array([hist.GetBinError(i)**2 for i in xrange(nBins)])
+	return contents, errors2
+
+def getBinnings(variables):
+	# (nBins, min, max) for every variable of a dict of Range definitions
+	return dict((var, (rangeDef.nBins, rangeDef.min, rangeDef.max)) for var, rangeDef in variables.iteritems())
+
+def fillHistograms(binnings, tree, event_weight, extra_weight, name, preselection, lumi, nProcesses=1, maxMemory=None, replicas=None, entryOffsets=None):
+	# books the weighted and the MC histograms of all variables and fills them with one pass over the tree
+	# returns a dict var -> (hist, histMC), equivalent to calling getHistogram twice for each variable
+	# maxMemory: the tree is read in chunks of entries, such that the buffers stay below this size (in bytes)
+	# replicas: (nReplicas, seed), the weighted histograms get bootstrap replicas (see bootstrap.py)
+	# entryOffsets: for a chain with a subset of the files of the sample, see getEntryOffsets
+	if nProcesses > 1 and tree.GetListOfFiles().GetEntries() > 1:
+		return fillHistogramsSharded(binnings, tree, event_weight, extra_weight, name, preselection, lumi, nProcesses, maxMemory, replicas)
+
+	variables = list(binnings)
+	expressions = variables + [str(event_weight)]
+	if replicas:
+		expressions.append(ENTRY)
+
+	hists = {}
+	empty = numpy.zeros(0)
+	emptyReplicas = numpy.zeros((replicas[0], 0)) if replicas else None
+	for var in variables:
+		nBins, minV, maxV = binnings[var]
+		hist = makeHistogram(name + "_" + sanitise(var), nBins, minV, maxV, empty, empty, emptyReplicas)
+		histMC = makeHistogram(name + "MC_" + sanitise(var), nBins, minV, maxV, empty, empty)
+		hists[var] = (hist, histMC)
+
+	for columns, weights in readColumnChunks(tree, expressions, str(extra_weight) + "*(" + str(preselection) + ")", maxMemory):
+		replicaWeights = None
+		if replicas:
+			entries = columns.pop()
+			if entryOffsets is not None:
+				entries = globalEntries(entries, entryOffsets)
+			replicaWeights = bootstrap.replicaWeights(entries, replicas[0], name, replicas[1])
+		eventWeights = columns.pop() * weights * lumi
+		for var, values in zip(variables, columns):
+			hist, histMC = hists[var]
+			fillHistogram(hist, values, eventWeights, replicaWeights)
+			fillHistogram(histMC, values, weights)
+
+	return hists
+
+def getEntryOffsets(tree, shards):
+	# the entry numbers start at 0 for the chain of each shard, for the bootstrap replica weights they are converted
+	# to the entry numbers of the full chain: for each shard the first entry of its files in its own and in the full chain
+	tree.GetEntries() # the number of entries of all files is only known after this
+	fileEntries = [element.GetEntries() for element in tree.GetListOfFiles()]
+	firstEntries = numpy.cumsum([0] + fileEntries[:-1])
+	offsets = []
+	for shard in shards:
+		shardEntries = [fileEntries[i] for i in shard]
+		offsets.append((numpy.cumsum([0] + shardEntries[:-1]), firstEntries[shard]))
+	return offsets
+
+def globalEntries(entries, entryOffsets):
+	# entries of a shard -> entries of the full chain, a file without entries has the same first entry as the next one
+	shardFirst, chainFirst = entryOffsets
+	files = numpy.searchsorted(shardFirst, entries, side="right") - 1
+	return entries - shardFirst[files] + chainFirst[files]
+
+# the chain which is split between the worker processes, it is inherited when the processes are forked
+_SHARDED_TREE = None
+
+def fillHistogramsShard(args):
+	shard, binnings, event_weight, extra_weight, name, preselection, lumi, maxMemory, replicas, entryOffsets = args
+	files = list(_SHARDED_TREE.GetListOfFiles())
+	tree = cloneChain(_SHARDED_TREE, [files[i] for i in shard])
+	return fillHistograms(binnings, tree, event_weight, extra_weight, name, preselection, lumi, maxMemory=maxMemory, replicas=replicas, entryOffsets=entryOffsets)
+
+def fillHistogramsSharded(binnings, tree, event_weight, extra_weight, name, preselection, lumi, nProcesses, maxMemory=None, replicas=None):
+	# the files of the chain are distributed over the processes, each process fills partial histograms
+	# which are added afterwards (contents, sum of squared weights and entries)
+	global _SHARDED_TREE
+	nFiles = tree.GetListOfFiles().GetEntries()
+	nProcesses = min(nProcesses, nFiles)
+	shards = [range(i, nFiles, nProcesses) for i in xrange(nProcesses)]
+
+	# the memory limit is shared by all processes
+	if maxMemory:
+		maxMemory = maxMemory / nProcesses
+
+	entryOffsets = getEntryOffsets(tree, shards) if replicas else [None] * len(shards)
+
+	_SHARDED_TREE = tree
+	outputWriter.drainWriters()
+	pool = multiprocessing.Pool(nProcesses)
+	try:
+		results = pool.map(fillHistogramsShard, [(shard, binnings, str(event_weight), extra_weight, name, preselection, lumi, maxMemory, replicas, offsets) for shard, offsets in zip(shards, entryOffsets)])
+	finally:
+		pool.close()
+		pool.join()
+		_SHARDED_TREE = None
+
+	hists = results[0]
+	for result in results[1:]:
+		for var, (hist, histMC) in result.iteritems():
+			hists[var][0].Add(hist)
+			hists[var][1].Add(histMC)
+
+	return hists
+
+def applyCut(tree, selection, name):
+	# restricts the tree to the entries passing the selection
+	# entries which are not in the current entry list are not evaluated again
+	drawTree(tree, ">>" + name, str(selection), "entrylist")
+	elist = ROOT.gDirectory.Get(name)
+
+	if not elist:
+		print "ERROR: entry list for ", selection, " could not be created"
+		sys.exit(1)
+
+	elist.SetDirectory(ROOT.gROOT)
+	tree.SetEntryList(elist)
+
+	return elist
+
+def cloneChain(chain, files=None):
+	# a new chain reading the same trees (or only the given subset of them) with its own file handles
+	if files is None:
+		files = list(chain.GetListOfFiles())
+	clone = ROOT.TChain(chain.GetName())
+	for element in files:
+		clone.Add(element.GetTitle() + "/" + element.GetName())
+
+	elist = chain.GetEntryList()
+	if elist:
+		clone.SetEntryList(elist)
+
+	# the same branches are read as for the original chain, the branch status of a chain is kept
+	# in a list which is applied to each tree when it is loaded (also if no tree is loaded yet)
+	for element in chain.GetStatus() or []:
+		clone.SetBranchStatus(element.GetName(), element.GetStatus())
+
+	return clone
+
+# numbers (including exponents) and names (including members a.b and scopes TMath::Abs, special functions Alt$)
+TOKEN = re.compile(r"(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?|[A-Za-z_]\w*(::[A-Za-z_]\w*)*(\.[A-Za-z_]\w*)*\$?")
+RESERVED_NAMES = set(["true", "false"])
+
+def getExpressionNames(expression):
+	# names in a TTree::Draw expression which can be branches or aliases
+	names = set()
+	expression = str(expression)
+	for match in TOKEN.finditer(expression):
+		name = match.group(0)
+		if name[0].isdigit() or name[0] == "." or name.endswith("$") or "::" in name or name in RESERVED_NAMES:
+			continue
+		if expression[match.end():].lstrip().startswith("("):
+			# a function, or a method of a branch (e.g. jets.size())
+			if "." not in name:
+				continue
+			name = name.rsplit(".", 1)[0]
+		names.add(name)
+	return names
+
+def getBranchNames(tree, expressions):
+	# names of the branches needed for the expressions, aliases are resolved
+	# returns the branches and the names which are neither a branch nor an alias
+	branches = set()
+	unresolved = set()
+	todo = set()
+	for expression in expressions:
+		todo |= getExpressionNames(expression)
+
+	done = set()
+	while todo:
+		name = todo.pop()
+		done.add(name)
+		alias = tree.GetAlias(name)
+		if alias:
+			todo |= getExpressionNames(alias) - done
+			continue
+
+		branch = tree.GetBranch(name)
+		if not branch:
+			leaf = tree.GetLeaf(name)
+			branch = leaf.GetBranch() if leaf else None
+		if not branch and "." in name:
+			# a member of an object branch
+			branch = tree.GetBranch(name.split(".")[0])
+		if branch:
+			branches.add(branch.GetName())
+		else:
+			unresolved.add(name)
+	return sorted(branches), sorted(unresolved)
+
+def pruneBranches(tree, expressions, print_branches=False):
+	# only the branches used in the expressions are read from the tree
+	# if a name cannot be resolved, all branches are read: a disabled branch would silently be read as zero
+	branches, unresolved = getBranchNames(tree, expressions)
+	if unresolved:
+		print "WARNING:", " ".join(unresolved), "not found in", tree.GetName() + ", all branches are read"
+		tree.SetBranchStatus("*", 1)
+		return None
+
+	tree.SetBranchStatus("*", 0)
+	for name in branches:
+		tree.SetBranchStatus(name, 1)
+
+	if print_branches:
+		print "branches read from", tree.GetName() + ":", " ".join(branches)
+	return branches
+
 def load_chain(filenames, treename, print_files=False):
 	if type(treename)==str:
-		chain = TChain(treename)
+		chain = ROOT.TChain(treename)
 		for name in filenames:
 			chain.Add(name)
 	elif type(treename)==list:
-		chain = TChain(treename[0])
+		chain = ROOT.TChain(treename[0])
 		for name,treename in zip(filenames,treename):
 			chain.Add(name+"/"+treename)
 